@@ -0,0 +1,175 @@
+"""
+Offline benchmark of the refresh pipeline on synthetic data:
+
+    python benchmark.py
+    python benchmark.py --days 300 --counties 3200 --save-baseline
+    python benchmark.py --baseline ../benchmarks/baseline.json
+
+Runs the real loaders and aggregators on generated JHU/NYT files,
+reports rows/sec and peak memory per stage, and compares against a
+saved baseline. Exits non-zero when a stage regresses past --tolerance.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+from collections import OrderedDict
+import output_writers
+from stage_cache import STAGE_CACHE
+from country_codes import get_resolver
+from profiling import PROFILER, peak_rss_bytes
+from synthetic_data import make_sources
+from jhu_global_data import JHUDataGlobal
+from nyt_us_data import NYTDataCountyLevel
+from utils import AddDailyFields
+from data_aggregators import GlobalDataJHU, USDataNYT, JHUCountryAggregate
+
+LOGGER = logging.getLogger()
+
+BENCHMARK_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'benchmarks')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+
+def run_pipeline(sources):
+    """ Run each code path once, recording stages with PROFILER """
+    jhu = JHUDataGlobal('cases', raw_data=sources['jhu_cases'])
+    with PROFILER.stage('JHUDataGlobal.run', jhu):
+        jhu.run()
+
+    jhu_daily = AddDailyFields(data_obj=jhu)
+    with PROFILER.stage('AddDailyFields.jhu', jhu_daily):
+        jhu_daily.create_daily_new_col()
+
+    nyt = NYTDataCountyLevel('cases_and_deaths', raw_data=sources['nyt_counties'])
+    with PROFILER.stage('NYTDataCountyLevel.run', nyt):
+        nyt.run()
+
+    nyt_daily = AddDailyFields(data_obj=nyt, dataset_names=['cases', 'deaths'])
+    with PROFILER.stage('AddDailyFields.nyt', nyt_daily):
+        nyt_daily.create_daily_new_col()
+
+    # The aggregators record their own stages. They pop the bytes
+    # they parse, so each gets its own copy of the dict.
+    JHU = GlobalDataJHU(sources=dict(sources))
+    JHU.run()
+    JHUCountryAggregate(JHU).run()
+    USDataNYT(sources=dict(sources)).run()
+
+
+def summarize(records):
+    """ Total seconds, rows and peak RSS rise per stage name, plus rows/sec """
+    stages = OrderedDict()
+    for record in records:
+        stage = stages.setdefault(record['stage'], {'seconds': 0.0, 'rows': 0, 'peak_rss_delta_bytes': 0})
+        stage['seconds'] += record['wall_seconds']
+        stage['rows'] += max(record['rows_in'] or 0, record['rows_out'] or 0)
+        stage['peak_rss_delta_bytes'] += record['peak_rss_delta_bytes'] or 0
+
+    for stage in stages.values():
+        stage['seconds'] = round(stage['seconds'], 4)
+        stage['rows_per_sec'] = round(stage['rows'] / stage['seconds']) if stage['seconds'] > 0 else None
+    return stages
+
+
+def run_benchmark(n_jhu_geos=300, n_counties=3000, n_days=150, seed=0):
+    """ Generate the data, run the pipeline offline and return the results """
+    sources = make_sources(n_jhu_geos, n_counties, n_days, seed)
+
+    # Nothing is read from or written to the real cache, output or ref folders;
+    # every setting is put back afterwards for whatever runs next in this process
+    cache_enabled = STAGE_CACHE.enabled
+    output_dir = output_writers.OUTPUT_DIR
+    resolver = get_resolver()
+    cache_file = resolver.cache_file
+    PROFILER.reset()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        STAGE_CACHE.enabled = False
+        output_writers.OUTPUT_DIR = tmp_dir
+        resolver.cache_file = os.path.join(tmp_dir, os.path.basename(cache_file))
+        try:
+            run_pipeline(sources)
+        finally:
+            STAGE_CACHE.enabled = cache_enabled
+            output_writers.OUTPUT_DIR = output_dir
+            resolver.cache_file = cache_file
+
+    return {'params': {'jhu_geos': n_jhu_geos, 'counties': n_counties, 'days': n_days, 'seed': seed},
+            'source_bytes': {name: len(data) for name, data in sources.items()},
+            'total_seconds': round(sum(r['wall_seconds'] for r in PROFILER.records), 4),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': summarize(PROFILER.records)}
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Stages whose throughput dropped, or whose memory grew,
+    by more than `tolerance` relative to the baseline
+    """
+    regressions = []
+    if baseline.get('params') != results['params']:
+        LOGGER.warning(f"Baseline was run with {baseline.get('params')}, not {results['params']}")
+
+    for name, stage in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+
+        if stage['rows_per_sec'] and before['rows_per_sec'] and stage['rows_per_sec'] < before['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['rows_per_sec']:,} rows/sec vs {before['rows_per_sec']:,} baseline")
+
+        memory_floor = 8 * 1024 ** 2  # ignore noise on small allocations
+        if stage['peak_rss_delta_bytes'] > max(before['peak_rss_delta_bytes'] * (1 + tolerance), memory_floor):
+            regressions.append(f"{name}: peak RSS +{stage['peak_rss_delta_bytes'] / 1024 ** 2:.0f} MB "
+                               f"vs +{before['peak_rss_delta_bytes'] / 1024 ** 2:.0f} MB baseline")
+
+    return regressions
+
+
+def print_results(results):
+    print(f"{'stage':<45}{'seconds':>10}{'rows':>12}{'rows/sec':>14}{'peak RSS +MB':>14}")
+    for name, stage in results['stages'].items():
+        rows_per_sec = f"{stage['rows_per_sec']:,}" if stage['rows_per_sec'] else '-'
+        print(f"{name:<45}{stage['seconds']:>10.3f}{stage['rows']:>12,}{rows_per_sec:>14}"
+              f"{stage['peak_rss_delta_bytes'] / 1024 ** 2:>14.1f}")
+    peak = results['peak_rss_bytes']
+    print(f"Total {results['total_seconds']:.2f}s" + ('' if peak is None else f", peak RSS {peak / 1024 ** 2:.0f} MB"))
+
+
+if __name__ == '__main__':
+    LOGGER.setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description='Benchmark the refresh pipeline on synthetic data')
+    parser.add_argument('--jhu-geos', type=int, default=300, help='Rows (province/country) in the JHU files')
+    parser.add_argument('--counties', type=int, default=3000, help='Counties in the NYT file')
+    parser.add_argument('--days', type=int, default=150, help='Days of history')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown/memory growth (0.2 = 20%%)')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.jhu_geos, args.counties, args.days, args.seed)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            print('\n'.join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline")
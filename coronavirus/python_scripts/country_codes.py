@@ -0,0 +1,136 @@
+"""
+Resolve country names to 2 and 3 letter country codes.
+Results are kept in a lookup table in ref_data/ so pycountry's
+(slow) fuzzy search only ever runs once per new country name.
+Names resolved during a refresh go to a cache file instead; the
+tracked table is only rewritten by refresh_ref_data.py.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import logging
+import threading
+from functools import lru_cache
+import pandas as pd
+from pycountry import countries
+from schema import map_values
+
+LOGGER = logging.getLogger()
+
+LOOKUP_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'ref_data', 'ref_country_code_lookup.csv')
+
+CACHE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'cache', 'country_code_lookup.csv')
+
+LOOKUP_COLS = ['country', 'country_code_2', 'country_code_3']
+
+
+def read_lookup(path):
+    """ A saved lookup table as a dict (empty if the file doesn't exist) """
+    if not os.path.exists(path):
+        return {}
+
+    # keep_default_na=False so Namibia's 'NA' code isn't read as missing
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return {row.country: (row.country_code_2 or None, row.country_code_3 or None)
+            for row in df.itertuples(index=False)}
+
+
+def write_lookup(lookup, path):
+    """
+    Write a lookup table through a temp file and os.replace, so a
+    reader (or a second process writing at once) never sees a torn file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = pd.DataFrame([(name, codes[0], codes[1]) for name, codes in lookup.items()],
+                      columns=LOOKUP_COLS)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    df.sort_values('country').to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+class CountryCodeResolver():
+    """
+    Country name -> (alpha_2, alpha_3) backed by the lookup table in
+    ref_data/ plus a cache of names resolved since.
+    Names pycountry can't match are stored with blank codes so they
+    aren't searched for again.
+    """
+    def __init__(self, lookup_file=LOOKUP_FILE, cache_file=CACHE_FILE):
+        self.lookup_file = lookup_file
+        self.cache_file = cache_file
+        self.lookup = self.load_lookup()
+        self.new_names = 0
+
+    def load_lookup(self):
+        """ Load the saved lookup table, and any cached names, as a dict """
+        lookup = read_lookup(self.cache_file)
+        # The reviewed table in ref_data/ wins over the cache
+        lookup.update(read_lookup(self.lookup_file))
+        return lookup
+
+    def save_lookup(self):
+        """ Add anything newly resolved to the cache file """
+        if not self.new_names:
+            return
+
+        tracked = read_lookup(self.lookup_file)
+        # Keep names another process cached since this one started
+        cached = read_lookup(self.cache_file)
+        cached.update({name: codes for name, codes in self.lookup.items() if name not in tracked})
+        write_lookup(cached, self.cache_file)
+        LOGGER.info(f"Cached {self.new_names} new names for the country code lookup")
+        self.new_names = 0
+
+    def save_to_ref(self):
+        """
+        Fold every cached name into the tracked table in ref_data/
+        (run from refresh_ref_data.py, never from the daily refresh)
+        """
+        self.save_lookup()
+        self.lookup = self.load_lookup()
+        tracked = read_lookup(self.lookup_file)
+        added = len(set(self.lookup) - set(tracked))
+        if added:
+            write_lookup(self.lookup, self.lookup_file)
+            LOGGER.info(f"Saved {added} new names to the country code lookup")
+
+    def resolve(self, name):
+        """
+        Return (alpha_2, alpha_3) for a country name.
+        self.lookup is the memo: every name searched for is added to it.
+        """
+        if name in self.lookup:
+            return self.lookup[name]
+
+        try:
+            match = countries.search_fuzzy(name)[0]
+            codes = (match.alpha_2, match.alpha_3)
+        except LookupError:
+            LOGGER.warning(f"No country code found for {name}")
+            codes = (None, None)
+
+        self.lookup[name] = codes
+        self.new_names += 1
+        return codes
+
+    def add_codes(self, df, name_col, code_2_col='country_code_2', code_3_col='country_code_3'):
+        """
+        Add both code columns to df, resolving each distinct name once
+        """
+        names = df[name_col].dropna().unique()
+        resolved = {name: self.resolve(name) for name in names}
+
+        df[code_2_col] = map_values(df[name_col], {name: codes[0] for name, codes in resolved.items()})
+        df[code_3_col] = map_values(df[name_col], {name: codes[1] for name, codes in resolved.items()})
+
+        self.save_lookup()
+        return df
+
+
+@lru_cache(maxsize=None)
+def get_resolver():
+    """ Shared resolver so the lookup table is only read once per process """
+    return CountryCodeResolver()
@@ -4,35 +4,108 @@ Johns Hopkins GitHub repo that contains
 data on the Coronavirus
 """
 # pylint: disable=invalid-name, line-too-long
-import os
 import logging
+import numpy as np
 import pandas as pd
-from pycountry import countries
-from nyt_us_data import NYTCountyCases, NYTCountyDeaths
+from nyt_us_data import NYTCountyCasesAndDeaths
 from jhu_global_data import JHUCountryCases, JHUCountryDeaths
 import utils
+import output_writers
+from country_codes import get_resolver
+from ref_data_registry import REF_DATA
+from schema import apply_schema, map_values
+from geo_keys import GEO_ID_COL, combined_codes, encode_geo_keys, key_labels
+from stage_cache import STAGE_CACHE
+from source_fetcher import SOURCE_URLS
+from http_cache import HTTP_CACHE
+from profiling import PROFILER
+from rolling_metrics import RollingMetrics
 
 
 LOGGER = logging.getLogger()
 
 class GlobalDataJHU():
-    def __init__(self):
-        self.cases = JHUCountryCases().data
-        self.deaths = JHUCountryDeaths().data
+    output_name = 'HOPKINS_CLEANED'
+
+    # Columns that identify one geography in the saved output
+    history_key_cols = ['province_or_state', 'country_or_region']
+
+    # Columns geo_id is built from (and fips, where there is one)
+    geo_label_cols = ['province_or_state', 'country_or_region']
+    geo_fips_col = None
+
+    # (key_col, new_col_name, min_case_value) for each zero day rank
+    zero_day_specs = [(GEO_ID_COL, 'first_case_state_rank', 5),
+                      (GEO_ID_COL, 'hundred_case_state_rank', 100),
+                      ('country_or_region', 'first_case_country_rank', 5),
+                      ('country_or_region', 'hundred_case_country_rank', 100)]
+
+    # Attribute lookups that only depend on these geography columns,
+    # run by enrich_geographies on one row per distinct geography
+    dimension_cols = ['country_or_region']
+    enrichment_methods = ['add_in_country_codes',
+                          'add_country_population',
+                          'add_country_median_age']
+
+    # Trailing averages, growth and doubling time added to the output
+    rolling_metrics = RollingMetrics()
+
+    # Sources the load stage parses
+    source_names = ['jhu_cases', 'jhu_deaths']
+
+    def __init__(self, sources=None, incremental=False):
+        # sources: optional dict of pre-fetched CSV data (bytes or cached
+        # file paths) by source name. Nothing is parsed until run(), so
+        # unchanged sources can be restored from the stage cache unparsed.
+        self.sources = {} if sources is None else sources
+        self.cases = None
+        self.deaths = None
+        self.setup_incremental(incremental)
+
+    def fetch_sources(self):
+        """ The raw data for each source, downloading any that wasn't pre-fetched """
+        for name in self.source_names:
+            if self.sources.get(name) is None:
+                self.sources[name] = HTTP_CACHE.get_file(SOURCE_URLS[name])
+        return [self.sources[name] for name in self.source_names]
+
+    def cache_settings(self):
+        """ Settings that change the output, for the stage cache key """
+        return None
+
+    def load(self):
+        """
+        Parse the cases and deaths files. Each source is popped as
+        it is parsed so the bytes can be freed.
+        """
+        self.cases = JHUCountryCases(raw_data=self.sources.pop('jhu_cases', None)).data
+        self.deaths = JHUCountryDeaths(raw_data=self.sources.pop('jhu_deaths', None)).data
+
+    def setup_incremental(self, incremental):
+        """
+        incremental=True only processes dates newer than the last saved output
+        """
+        self.incremental = incremental
+        # Key of the last cached stage, for pipelines built on this one
+        self.cache_key = None
+        self.is_incremental = False
+        self.previous = None
+        self.rank_offsets = {}
     
     def initial_merge(self):
         deaths = self.deaths[["running_total_deaths",
                                      "date",
-                                     "state_and_country",
+                                     GEO_ID_COL,
                                      "running_total_deaths_prev_day",
                                      "daily_new_deaths",
                                     ]]
         
         df = self.cases.merge(deaths, 
                      how="left", 
-                     on=["date", "state_and_country"]
+                     on=["date", GEO_ID_COL]
                     )
 
+        df = apply_schema(df)
         self.df_original = df
         self.data = df                    
     
@@ -46,106 +119,86 @@ class GlobalDataJHU():
         from there
         """
         print("Zero day for states")
-        df = self.data
-
-        cases_only = df.loc[df["running_total_cases"] >= min_case_value]
-        states = cases_only.groupby([key_col,'date'])['daily_new_cases'].sum().reset_index()
-        states[new_col_name] = states.groupby([key_col])["date"].rank(ascending=True)
-
-        states = states[[key_col, new_col_name, 'date']]
-        df = df.merge(states,
-                how='left',
-                on=[key_col,'date']) 
+        spec = (key_col, new_col_name, min_case_value)
+        self.data[new_col_name] = utils.zero_day_ranks(self.data, [spec])[new_col_name]
+        self.add_rank_offset(key_col, new_col_name)
 
-        self.data = df
+    def add_rank_offset(self, key_col, new_col_name):
+        """
+        Incremental runs carry on counting from the saved output
+        """
+        if new_col_name in self.rank_offsets:
+            offsets = map_values(self.data[key_col], self.rank_offsets[new_col_name]).fillna(0)
+            self.data[new_col_name] = self.data[new_col_name] + offsets
 
     def zero_day_adds(self):
-        self.zero_day_field_creator(key_col='state_and_country',
-                                    new_col_name='first_case_state_rank',
-                                    min_case_value=5)
-        
-        self.zero_day_field_creator(key_col='state_and_country',
-                                    new_col_name='hundred_case_state_rank',
-                                    min_case_value=100)
-        
-        self.zero_day_field_creator(key_col='country_or_region',
-                                    new_col_name='first_case_country_rank',
-                                    min_case_value=5)
-        
-        self.zero_day_field_creator(key_col='country_or_region',
-                                    new_col_name='hundred_case_country_rank',
-                                    min_case_value=100)     
+        """
+        All zero day rank columns in one sorted pass per key column
+        """
+        LOGGER.info("Zero day ranks")
+        ranks = utils.zero_day_ranks(self.data, self.zero_day_specs)
+        for key_col, new_col_name, _ in self.zero_day_specs:
+            self.data[new_col_name] = ranks[new_col_name]
+            self.add_rank_offset(key_col, new_col_name)
         
     def add_in_country_codes(self):
         """
         Add in 2 and 3 letter country codes using
-        pycountry module
+        pycountry module (through the cached resolver)
         """
         print("Adding in country codes")
-        df = self.data.copy()
-        JH_countries = df[['country_or_region']].copy().drop_duplicates()
-
-        JH_countries['country_code_2'] = ''
-        JH_countries['country_code_3'] = ''
-
-        for index, row in JH_countries.iterrows():
-            country = row[0]
-            #print(country)
-            try:
-                alpha_2 = countries.search_fuzzy(country)[0].alpha_2
-                alpha_3 = countries.search_fuzzy(country)[0].alpha_3
-                row['country_code_2'] = alpha_2
-                row['country_code_3'] = alpha_3
-            except LookupError:
-                pass
-            
-        df = df.merge(JH_countries,
-            how='left',
-            on='country_or_region')
-        
-        self.data = df   
+        self.data = get_resolver().add_codes(self.data, 'country_or_region')
 
     def add_country_population(self):
         """
         Add in country population from ref table
         """
-        dirname = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        ref_path = os.path.join(dirname, 'ref_data','ref_country_population.csv')
-        ref = pd.read_csv(ref_path)
-        ref = ref[['country_code_3','country_population_2018']].drop_duplicates()
-
-        self.data = self.data.merge(ref,
-                how='left',
-                on='country_code_3')  
+        population = REF_DATA.lookup('country_population', 'country_population_2018')
+        self.data['country_population_2018'] = map_values(self.data['country_code_3'], population)
 
     def add_country_median_age(self):
         """
-        Add in country median age from ref utils
+        Add in country median age from ref table
         """        
-        df = self.data.copy()
-        
-        directory = os.path.dirname(os.path.dirname(__file__))
-        filepath = os.path.join(directory, 'ref_data','ref_median_age_country.csv')
-        df_age = pd.read_csv(filepath)
-
-        df = df.merge(df_age[['country_code_3','median_years']],
-                how='left',
-                on='country_code_3')
-        df = df.rename(columns={'median_years':'country_median_age'})
-        
-        self.data = df                           
-
-    def add_country_daily_new_agg(self):
-        df = self.data
-        agg_country_new = df.groupby(['country_or_region','date'])['running_total_cases'].sum().reset_index(name='country_running_agg')
+        median_age = REF_DATA.lookup('median_age_country', 'median_years')
+        self.data['country_median_age'] = map_values(self.data['country_code_3'], median_age)
 
-        df = df.merge(agg_country_new,
-                how='left',
-                on=['country_or_region','date'])
+    def enrich_geographies(self):
+        """
+        Run every enrichment method on a small dimension table with one
+        row per distinct geography, then attach all the new columns
+        to the full frame with a single indexer
+        """
+        fact = self.data
+        _, first_rows, inverse = np.unique(combined_codes(fact, self.dimension_cols),
+                                           return_index=True, return_inverse=True)
+        dims = fact[self.dimension_cols].iloc[first_rows].reset_index(drop=True)
+
+        # The enrichment methods work on self.data, so point it at the dimension table
+        self.data = dims
+        try:
+            for method in self.enrichment_methods:
+                getattr(self, method)()
+            dims = self.data
+        finally:
+            self.data = fact
+
+        for col in dims.columns.drop(self.dimension_cols):
+            values = dims[col].take(inverse)
+            values.index = fact.index
+            fact[col] = values
+
+        self.data = apply_schema(fact)
 
-        self.data = df
+    def add_country_daily_new_agg(self):
+        self.data['country_running_agg'] = (
+            self.data.groupby(['country_or_region', 'date'], observed=True)['running_total_cases']
+            .transform('sum'))
+        self.data = apply_schema(self.data)
 
     def order_cols(self):
+        # Readable key is only built for the output
+        self.data['state_and_country'] = key_labels(self.data, self.geo_label_cols)
         self.data = self.data[['country_or_region',
                 'province_or_state',
                 'state_and_country',
@@ -170,65 +223,150 @@ class GlobalDataJHU():
                 'country_running_agg',
                 ]]
 
+    def load_previous_output(self):
+        """ Load the last saved output, or None if there isn't one """
+        return output_writers.read_output(self.output_name)
+
+    def history_unchanged(self, previous):
+        """
+        Check the running totals we already saved still match upstream
+        for every geography and date up to the last saved date
+        """
+        cols = self.history_key_cols + ['date', 'running_total_cases', 'running_total_deaths']
+        last_date = previous['date'].max()
+        current = self.data.loc[self.data['date'] <= last_date, cols]
+
+        if len(current) != len(previous):
+            return False
+
+        compare = current.merge(previous[cols],
+                                how='outer',
+                                on=self.history_key_cols + ['date'],
+                                indicator=True)
+        if (compare['_merge'] != 'both').any():
+            return False
+
+        for col in ['running_total_cases', 'running_total_deaths']:
+            now = compare[f'{col}_x'].astype(float).fillna(-1)
+            before = compare[f'{col}_y'].astype(float).fillna(-1)
+            if (now != before).any():
+                return False
+
+        return True
+
+    def prepare_incremental(self):
+        """
+        Cut self.data down to the dates missing from the saved output.
+        Falls back to a full rebuild when there is no saved output
+        or upstream has revised history.
+        """
+        previous = self.load_previous_output()
+        if previous is None or previous.empty:
+            LOGGER.info("No previous output found - running a full rebuild")
+            return
+
+        if not self.history_unchanged(previous):
+            LOGGER.info("Upstream history has been revised - running a full rebuild")
+            return
+
+        last_date = previous['date'].max()
+        self.data = self.data.loc[self.data['date'] > last_date].copy()
+        LOGGER.info(f"Incremental run: {len(self.data)} new rows after {last_date:%Y-%m-%d}")
+
+        # Ranks for new dates continue from the highest rank already saved
+        previous_ids = encode_geo_keys(previous, self.geo_label_cols, self.geo_fips_col)
+        for key_col, new_col_name, _ in self.zero_day_specs:
+            keys = previous_ids if key_col == GEO_ID_COL else previous[key_col]
+            self.rank_offsets[new_col_name] = previous.groupby(keys, observed=True)[new_col_name].max()
+
+        self.previous = previous
+        self.is_incremental = True
+
+    def append_to_previous(self):
+        """ Put the newly processed dates back onto the saved output """
+        if not self.is_incremental:
+            return
+        self.data = pd.concat([self.previous, self.data], axis=0, ignore_index=True)
+        self.data = apply_schema(self.data)
+
+    def add_rolling_metrics(self):
+        """
+        Rolling metric columns per geography. Runs on the finished
+        output (after any incremental append) so windows always
+        see the full history.
+        """
+        keys = encode_geo_keys(self.data, self.geo_label_cols, self.geo_fips_col)
+        metrics = self.rolling_metrics.compute(self.data, keys)
+        # assign, as self.data is usually a column selection made by order_cols
+        self.data = self.data.assign(**{col: metrics[col] for col in self.rolling_metrics.columns()})
+
     def save_output_to_CSV(self):
         LOGGER.info("Saving JHU to CSV")
-        filename = os.path.abspath(__file__)
-        directory = os.path.dirname(os.path.dirname(filename))
-        output_file = os.path.join(directory, 'output_data', 'HOPKINS_CLEANED.csv')
-        
-        self.data.to_csv(output_file, index=False)                
+        output_writers.write_output(self.data, self.output_name)
+
+    def stages(self):
+        """ Steps run after the initial merge, in order """
+        return [self.zero_day_adds,
+                self.enrich_geographies,
+                self.add_country_daily_new_agg,
+                self.order_cols]
 
     def run(self):
         """
         Main run function to execute logic
         """
-        self.initial_merge()
-        self.zero_day_adds()
-        self.add_in_country_codes()
-        self.add_country_population()
-        self.add_country_median_age()
-        self.add_country_daily_new_agg()
-        self.order_cols()  
-        self.save_output_to_CSV()
+        name = type(self).__name__
+        if self.incremental:
+            # Incremental runs build on the saved output, so skip the stage cache
+            for stage in ([self.load, self.initial_merge, self.prepare_incremental] + self.stages()
+                          + [self.append_to_previous, self.add_rolling_metrics]):
+                with PROFILER.stage(f'{name}.{stage.__name__}', self):
+                    stage()
+        else:
+            # Keyed on the raw sources, so a hit skips parsing them entirely
+            input_key = STAGE_CACHE.input_key(name, sources=self.fetch_sources(), extra=self.cache_settings())
+            self.cache_key = STAGE_CACHE.run_stages(
+                self, [self.load, self.initial_merge] + self.stages() + [self.add_rolling_metrics], input_key)
+
+        with PROFILER.stage(f'{name}.save_output_to_CSV', self):
+            self.save_output_to_CSV()
 
 
 class USDataNYT(GlobalDataJHU):
-    def __init__(self):
-        self.cases = NYTCountyCases().data
-        self.deaths = NYTCountyDeaths().data
+    output_name = 'NYT_US_state_data'
+
+    history_key_cols = ['province_or_state', 'county']
+
+    geo_label_cols = ['province_or_state', 'county']
+    geo_fips_col = 'fips'
+
+    zero_day_specs = [('province_or_state', 'first_case_state_rank', 5),
+                      ('province_or_state', 'hundred_case_state_rank', 100),
+                      ('county', 'first_case_county_rank', 5),
+                      ('county', 'hundred_case_county_rank', 100)]
+
+    dimension_cols = ['country_or_region', 'province_or_state', 'county']
+    enrichment_methods = GlobalDataJHU.enrichment_methods + ['add_US_state_population',
+                                                             'add_US_state_codes',
+                                                             'add_US_county_zip']
+
+    source_names = ['nyt_counties']
+
+    def __init__(self, sources=None, incremental=False):
+        self.sources = {} if sources is None else sources
+        self.setup_incremental(incremental)
+
+    def load(self):
+        """
+        Cases and deaths come from the same file, so read it once
+        """
+        self.data = NYTCountyCasesAndDeaths(raw_data=self.sources.pop('nyt_counties', None)).data
 
-    def zero_day_adds(self):
-        self.zero_day_field_creator(key_col='province_or_state',
-                                    new_col_name='first_case_state_rank',
-                                    min_case_value=5)
-        
-        self.zero_day_field_creator(key_col='province_or_state',
-                                    new_col_name='hundred_case_state_rank',
-                                    min_case_value=100)
-        
-        self.zero_day_field_creator(key_col='county',
-                                    new_col_name='first_case_county_rank',
-                                    min_case_value=5)
-        
-        self.zero_day_field_creator(key_col='county',
-                                    new_col_name='hundred_case_county_rank',
-                                    min_case_value=100)   
-    
     def initial_merge(self):
-        deaths = self.deaths[["running_total_deaths",
-                                     "date",
-                                     "state_and_county",
-                                     "running_total_deaths_prev_day",
-                                     "daily_new_deaths",
-                                    ]]
-        
-        df = self.cases.merge(deaths, 
-                     how="left", 
-                     on=["date", "state_and_county"]
-                    )    
-        
-        self.df_original = df
-        self.data = df
+        """
+        Cases and deaths already share a frame - nothing to join
+        """
+        self.df_original = self.data
         
     def order_cols(self):        
                self.data = self.data[['country_or_region',
@@ -263,102 +401,73 @@ class USDataNYT(GlobalDataJHU):
                 ]]     
     
     def add_US_state_population(self):
-        state_pop = utils.pull_US_state_population_data()
-
-        self.data = self.data.merge(state_pop,
-                how='left',
-                left_on='province_or_state',
-                right_on='state')   
+        """
+        Add state population from the local snapshot
+        (refreshed separately by refresh_ref_data.py)
+        """
+        state_pop = REF_DATA.lookup('us_state_population', 'us_state_pop_2019_estimate')
+        self.data['us_state_pop_2019_estimate'] = map_values(self.data['province_or_state'], state_pop)
 
     def add_US_state_codes(self):
-        ref = utils.load_ref_US_state()
-
-        self.data = self.data.merge(ref[['state_code','state_name']].drop_duplicates('state_name'),
-                                    how='left',
-                                    left_on='province_or_state',
-                                    right_on='state_name')     
-        
-        self.data.drop('state_name', 
-                       axis=1,
-                       inplace=True)     
+        state_codes = REF_DATA.lookup('us_states', 'state_code')
+        self.data['state_code'] = map_values(self.data['province_or_state'], state_codes)
 
     def add_US_county_zip(self):
-        ref = utils.load_ref_US_county_info()
-
-        ref.drop(['lat','long','test_county','test_state'], 
-                axis=1,
-                inplace=True)
+        ref = REF_DATA.lookup('county_zip', ['test_zipcode',
+                                             'test_population',
+                                             'test_population_density'])
 
-        ref.rename(columns={'test_zipcode':'county_zipcode',
+        ref = ref.rename(columns={'test_zipcode':'county_zipcode',
                         'test_population':'zipcode_population',
-                        'test_population_density':'zipcode_population_density'},
-                inplace=True)   
+                        'test_population_density':'zipcode_population_density'})
 
-        self.data = self.data.merge(ref,
-            how='left',
-            on=['state_code','county'])                                                               
+        self.data = apply_schema(self.data.join(ref, on=['state_code','county']))
 
     def save_output_to_CSV(self):
         LOGGER.info("Saving NYT to CSV")
-        filename = os.path.abspath(__file__)
-        directory = os.path.dirname(os.path.dirname(filename))
-        output_file = os.path.join(directory, 'output_data', 'NYT_US_state_data.csv')
-        
         #LOGGER.warning("TEST OF GITHUB FUNCTIONALITY")
         #self.data.sort_values('county', inplace=True)
-        self.data.to_csv(output_file, index=False)
+        output_writers.write_output(self.data, self.output_name)
 
-    def run(self):
-        """
-        Main run function to execute logic
-        """
-        self.initial_merge()
-        self.zero_day_adds()
-        self.add_in_country_codes()
-        self.add_country_population()
-        self.add_country_median_age()
-        self.add_country_daily_new_agg()
-        self.add_US_state_population()
-        self.add_US_state_codes()
-        self.add_US_county_zip()
-        self.order_cols()  
-        self.save_output_to_CSV()
+    def stages(self):
+        return [self.zero_day_adds,
+                self.enrich_geographies,
+                self.add_country_daily_new_agg,
+                self.order_cols]
         
                 
 
 class CauseOfDeath():
-    def __init__(self, NYT_obj):
+    def __init__(self, NYT_obj, country='US', causes=None):
         # We need the NYT class to use that data
         self.NYT = NYT_obj
-    
+        # Which country's COVID deaths and causes (ref_causes_of_death.csv)
+        # to compare, optionally limited to a subset of causes
+        self.country = country
+        self.causes = causes
+        self.output_name = f'{country}_causes_of_death'
+
+    def check_country(self):
+        """
+        Both sides of the comparison have to exist for the country:
+        COVID deaths in the source data and causes in the reference table
+        """
+        if not (self.NYT.data['country_or_region'] == self.country).any():
+            raise ValueError(f"No COVID deaths for {self.country} in {type(self.NYT).__name__} data")
+        if not (REF_DATA.get('causes_of_death')['country'] == self.country).any():
+            raise ValueError(f"No causes of death for {self.country} in the reference table")
+
     def prep_ref_table(self):
         """
         Return a DataFrame reference table for cause of death
         """
-        data = {'cause_of_death':['Heart disease',
-                        'Cancer',
-                        'Accidents (unintentional injuries)',
-                        'Chronic lower respiratory diseases',
-                        'Stroke (cerebrovascular diseases)',
-                        'Alzheimer’s disease',
-                        'Diabetes',
-                        'Influenza and pneumonia',
-                        'Nephritis, nephrotic syndrome, and nephrosis',
-                        'Intentional self-harm (suicide)',]
-                ,
-                'deaths_2017': [647457,
-                                    599108,
-                                    169936,
-                                    160201,
-                                    146383,
-                                    121404,
-                                    83564,
-                                    55672,
-                                    50633,
-                                    47173,]}
-
-        ref_cause_of_death = pd.DataFrame(data)
-        ref_cause_of_death['daily_average'] = ref_cause_of_death['deaths_2017'] / 365
+        ref = REF_DATA.get('causes_of_death')
+        ref = ref[ref['country'] == self.country]
+        if self.causes is not None:
+            ref = ref[ref['cause_of_death'].isin(self.causes)]
+
+        ref_cause_of_death = ref[['cause_of_death', 'deaths']].reset_index(drop=True)
+        ref_cause_of_death['daily_average'] = ref_cause_of_death['deaths'] / 365
 
         return ref_cause_of_death
 
@@ -367,7 +476,8 @@ class CauseOfDeath():
         Take the NYT US data and return a grouped DataFrame that has
         COVID deaths by day
         """
-        df = self.NYT.data.groupby(['date'])['daily_new_deaths'].sum().reset_index()
+        df = self.NYT.data.loc[self.NYT.data['country_or_region'] == self.country]
+        df = df.groupby(['date'])['daily_new_deaths'].sum().reset_index()
         df['cause_of_death'] = 'COVID-19'
         df = df.rename(columns={'daily_new_deaths':'daily_deaths'})   
 
@@ -379,49 +489,52 @@ class CauseOfDeath():
         Return an expanded reference table that has cause of death
         records for each date in US daily data
         """
-        # Create a copy of ref table for each date in main data
-        ref_list = []
-        for date in self.df_US_by_day.date.unique():
-            #print(date)
-            new_ref = self.prep_ref_table()
-            new_ref['date'] = date
-            ref_list.append(new_ref)
-
-        death_ref = pd.concat(ref_list, axis=0)
-        death_ref = death_ref.drop('deaths_2017', axis=1)
-        death_ref = death_ref.rename(columns={'daily_average':'daily_deaths'})
-
-        self.df_death_ref = death_ref
+        # One cross product of dates x causes instead of a copy per date
+        ref = self.prep_ref_table()
+        dates = self.df_US_by_day['date'].unique()
+
+        self.df_death_ref = pd.DataFrame({
+            'cause_of_death': np.tile(ref['cause_of_death'].to_numpy(), len(dates)),
+            'daily_deaths': np.tile(ref['daily_average'].to_numpy(), len(dates)),
+            'date': np.repeat(dates, len(ref)),
+        })
         
     def prep_output(self):
         """
         Combine ref data with COVID data
         """
-        df = pd.concat([self.df_US_by_day, self.df_death_ref], axis=0)
-        df = df.sort_values('date', ascending=False)
-        df['country'] = 'US'
+        df = pd.concat([self.df_US_by_day, self.df_death_ref], axis=0, ignore_index=True)
+        df = df.sort_values('date', ascending=False, kind='mergesort')
+        df['country'] = self.country
         self.data = df  
         
     def save_output_to_CSV(self):
         """ Save to CSV """
         LOGGER.info("Saving Cause of Death to CSV")
-        filename = os.path.abspath(__file__)
-        directory = os.path.dirname(os.path.dirname(filename))
-        output_file = os.path.join(directory, 'output_data', 'US_causes_of_death.csv')
-        
-        self.data.to_csv(output_file, index=False)        
+        output_writers.write_output(self.data, self.output_name)
         
         
     def run(self):
         """ Execute main logic """
-        self.prep_US_by_day()
-        self.prep_death_ref()
-        self.prep_output()
-        self.save_output_to_CSV()
+        self.check_country()
+        input_key = STAGE_CACHE.derived_key(type(self).__name__, self.NYT,
+                                            extra=(self.country, self.causes))
+        STAGE_CACHE.run_stages(self,
+                               [self.prep_US_by_day, self.prep_death_ref, self.prep_output],
+                               input_key,
+                               state_attrs=('df_US_by_day', 'df_death_ref', 'data'))
+        with PROFILER.stage('CauseOfDeath.save_output_to_CSV', self):
+            self.save_output_to_CSV()
 
 class JHUCountryAggregate():
-    def __init__(self, JHU_obj):
+    def __init__(self, JHU_obj, group_col='country_or_region', freq=None,
+                 output_name='JHU_aggregated_country_and_day'):
         self.JHU = JHU_obj
+        # Defaults give the country/day table; other granularities
+        # (e.g. freq='W', or another geography column) can be built on demand
+        self.group_col = group_col
+        self.freq = freq
+        self.output_name = output_name
 
         self.cols_to_sum = ['daily_new_cases',
                 'running_total_cases',
@@ -429,49 +542,79 @@ class JHUCountryAggregate():
                 'daily_new_deaths',
                 'running_total_deaths',
                 'running_total_deaths_prev_day',]
-        
-    def prep_country_ref(self):
-        df = self.JHU.data.copy()
-
-        df.drop_duplicates(['country_or_region','date'], inplace=True)
-
-        df = df[['country_or_region',
-                         'date',                                     
-                         'data_source',
-                         'lat',
-                         'long',
-                         'first_case_country_rank',
-                         'hundred_case_country_rank',
-                         'country_code_2',
-                         'country_code_3',
-                         'country_population_2018',
-                         'country_median_age',
-                         'country_running_agg']]
-        
-        return df
-    
-    def create_final_data(self):
-        jh = self.JHU.data
 
-        df = jh.groupby(['date','country_or_region'])[self.cols_to_sum].sum().reset_index()
-        country_info_ref = self.prep_country_ref()
+        # Carried through from the first row of each group
+        self.attribute_cols = ['data_source',
+                               'lat',
+                               'long',
+                               'first_case_country_rank',
+                               'hundred_case_country_rank',
+                               'country_code_2',
+                               'country_code_3',
+                               'country_population_2018',
+                               'country_median_age',
+                               'country_running_agg']
+
+    def present_attribute_cols(self, df, keys):
+        """ The attribute columns df actually has, other than the group keys """
+        return [col for col in self.attribute_cols if col in df.columns and col not in keys]
+
+    def aggregate(self, df, keys):
+        """
+        Sum the metrics and take each group's first row of attributes
+        in one groupby
+        """
+        grouped = df.groupby(keys, observed=True)
+        final_df = grouped[self.cols_to_sum].sum().reset_index()
+
+        # ngroup numbers groups in the same (sorted) order as the sums;
+        # rows with a missing key are dropped by the groupby and numbered -1
+        group_ids = grouped.ngroup().to_numpy()
+        in_group = np.flatnonzero(group_ids >= 0)
+        _, first = np.unique(group_ids[in_group], return_index=True)
+        first_rows = in_group[first]
+        attribute_cols = self.present_attribute_cols(df, keys)
+        attributes = df[attribute_cols].iloc[first_rows].reset_index(drop=True)
+
+        return pd.concat([final_df, attributes], axis=1)
+
+    def to_period(self, df):
+        """
+        Roll the daily table up to self.freq: new cases/deaths are
+        summed, running totals are taken at the end of each period
+        """
+        keys = ['date', self.group_col]
+        # Same attribute columns aggregate() carried through
+        attribute_cols = self.present_attribute_cols(df, keys)
 
-        final_df = df.merge(country_info_ref,
-                             how='left',
-                             on=['country_or_region','date'])
+        df = df.sort_values('date', kind='mergesort')
+        df['date'] = df['date'].dt.to_period(self.freq).dt.start_time
+
+        grouped = df.groupby(keys, observed=True)
+        running_cols = [col for col in self.cols_to_sum if col.startswith('running_total')]
+        new_cols = [col for col in self.cols_to_sum if col not in running_cols]
+
+        sums = grouped[new_cols].sum()
+        lasts = grouped[running_cols + attribute_cols].last()
+        return pd.concat([sums, lasts], axis=1)[self.cols_to_sum + attribute_cols].reset_index()
+
+    def create_final_data(self):
+        final_df = self.aggregate(self.JHU.data, ['date', self.group_col])
+
+        if self.freq is not None:
+            final_df = self.to_period(final_df)
 
         self.data = final_df    
         
     def save_output_to_CSV(self):
         """ Save to CSV """
         #LOGGER.info("Saving Cause of Death to CSV")
-        filename = os.path.abspath(__file__)
-        directory = os.path.dirname(os.path.dirname(filename))
-        output_file = os.path.join(directory, 'output_data', 'JHU_aggregated_country_and_day.csv')
-        
-        self.data.to_csv(output_file, index=False) 
+        output_writers.write_output(self.data, self.output_name)
         
     def run(self):
-        self.create_final_data()
-        self.save_output_to_CSV()        
+        input_key = STAGE_CACHE.derived_key(type(self).__name__, self.JHU,
+                                            extra=(self.group_col, self.freq))
+        STAGE_CACHE.run_stages(self, [self.create_final_data], input_key)
+        with PROFILER.stage('JHUCountryAggregate.save_output_to_CSV', self):
+            self.save_output_to_CSV()        
 
@@ -0,0 +1,104 @@
+"""
+Plumbing shared by the on-disk caches (HTTP downloads, pipeline stages):
+writes that go through a temp file, and least-recently-used eviction
+that never removes an entry the current run has used.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import time
+import logging
+import threading
+
+LOGGER = logging.getLogger()
+
+# File timestamps come from a coarser clock than time.time(), so an
+# entry touched just after the run started can look slightly older
+MTIME_SLACK_SECONDS = 2
+
+
+class DiskCache():
+    """
+    A folder of entries (files ending in `suffix`, each with optional
+    companion files) kept under max_bytes by evicting the least
+    recently used. Entries read or written since the cache object was
+    created are in use by this run and are never evicted, so a path
+    handed out earlier in the run can't disappear under its reader.
+    """
+    suffix = ''
+    companion_suffixes = ()
+    label = 'Cache'
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.run_started = time.time()
+        # Entries this process has used (other processes' show in their mtimes)
+        self.in_use = set()
+        self._lock = threading.Lock()
+
+    def write_atomic(self, path, write):
+        """
+        Call write(f) on a temp file and move it into place. The temp
+        file is removed if anything fails, so a crash or a broken
+        download never leaves a partial entry or a stray *.tmp behind.
+        Returns whatever write returns.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                result = write(f)
+            os.replace(tmp_path, path)
+            self.in_use.add(path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return result
+
+    def touch(self, path):
+        """ Mark an entry as used by this run """
+        os.utime(path)
+        self.in_use.add(path)
+
+    def entries(self):
+        """ Paths of every entry in the cache """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir) if name.endswith(self.suffix)]
+
+    def evict(self):
+        """ Drop least recently used entries until under max_bytes """
+        with self._lock:
+            entries = []
+            for path in self.entries():
+                try:
+                    entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+            entries.sort()
+
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if mtime >= self.run_started - MTIME_SLACK_SECONDS:
+                    # Used by this run - everything after it is newer still
+                    break
+                if path in self.in_use:
+                    continue
+                total -= size
+                LOGGER.info(f"{self.label} evicting {path}")
+                for companion in [path] + [path[:-len(self.suffix)] + suffix for suffix in self.companion_suffixes]:
+                    try:
+                        os.remove(companion)
+                    except FileNotFoundError:
+                        pass
+
+    def clear(self):
+        """ Remove everything from the cache """
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,86 @@
+"""
+Integer surrogate keys for geographies.
+Joins, diffs and ranks run on these ids instead of long
+concatenated strings like "Ontario-Canada"; readable labels
+are only built when a dataset is written out.
+"""
+# pylint: disable=invalid-name, line-too-long
+import numpy as np
+import pandas as pd
+
+GEO_ID_COL = 'geo_id'
+
+# FIPS codes are below this, hashed ids are above it
+FIPS_LIMIT = 100000
+
+
+def hash_labels(labels):
+    """
+    Stable (same across runs and processes) int64 id for each label string
+    """
+    hashed = pd.util.hash_array(np.asarray(labels, dtype=object))
+    return (hashed % np.uint64(2 ** 62)).astype(np.int64) + FIPS_LIMIT
+
+
+def combined_codes(df, cols):
+    """
+    One int64 per row that is equal for rows with the same values
+    in cols (missing values count as a value of their own)
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    for col in cols:
+        codes, uniques = pd.factorize(df[col])
+        combined = combined * (len(uniques) + 1) + (codes + 1)
+    return combined
+
+
+def encode_geo_keys(df, label_cols, fips_col=None):
+    """
+    One int64 id per row identifying its geography.
+    Uses the FIPS code where there is a valid one, otherwise a stable
+    hash of the label columns. Labels are only built for each distinct
+    combination, never per row.
+    """
+    n = len(df)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+
+    # Collapse the label columns into one integer per row
+    combined = combined_codes(df, label_cols)
+
+    _, first_row, inverse = np.unique(combined, return_index=True, return_inverse=True)
+
+    labels = df[label_cols[0]].iloc[first_row].astype(str).to_numpy(dtype=object)
+    for col in label_cols[1:]:
+        labels = labels + '-' + df[col].iloc[first_row].astype(str).to_numpy(dtype=object)
+
+    ids = hash_labels(labels)[inverse]
+
+    if fips_col is not None:
+        codes, uniques = pd.factorize(df[fips_col])
+        numeric = pd.to_numeric(pd.Series(uniques), errors='coerce').to_numpy(dtype=float)
+        fips = np.where(codes >= 0, numeric[codes], np.nan)
+        valid = (fips > 0) & (fips < FIPS_LIMIT)
+        ids = np.where(valid, np.nan_to_num(fips), ids).astype(np.int64)
+
+    return ids
+
+
+def add_geo_id(df, label_cols, fips_col=None):
+    """ Add the geo_id column to df """
+    df[GEO_ID_COL] = encode_geo_keys(df, label_cols, fips_col)
+    return df
+
+
+def key_labels(df, label_cols, sep='-'):
+    """
+    Readable "a-b" label per row (e.g. state_and_country), built once
+    per geo_id and mapped back as a categorical
+    """
+    firsts = df.drop_duplicates(GEO_ID_COL)
+    labels = firsts[label_cols[0]].astype(str)
+    for col in label_cols[1:]:
+        labels = labels + sep + firsts[col].astype(str)
+
+    mapping = pd.Series(labels.to_numpy(), index=firsts[GEO_ID_COL].to_numpy())
+    return df[GEO_ID_COL].map(mapping).astype('category')
@@ -0,0 +1,116 @@
+"""
+On-disk cache for the upstream CSV downloads.
+Stores the ETag/Last-Modified headers next to each payload and sends
+conditional requests so an unchanged file is answered with a 304
+instead of being downloaded again.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import json
+import hashlib
+import logging
+import requests
+from disk_cache import DiskCache
+
+LOGGER = logging.getLogger()
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'cache', 'http')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class HTTPCache(DiskCache):
+    """
+    Conditional-GET cache keyed by URL.
+    Least recently used payloads are evicted once the cache
+    grows past max_bytes.
+    """
+    suffix = '.bin'
+    companion_suffixes = ('.json',)
+    label = 'HTTP cache'
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, timeout=120):
+        super().__init__(cache_dir, max_bytes)
+        self.timeout = timeout
+
+    def _paths(self, url):
+        """ Payload and header file locations for a URL """
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return (os.path.join(self.cache_dir, f'{key}.bin'),
+                os.path.join(self.cache_dir, f'{key}.json'))
+
+    def _load_meta(self, url):
+        """ Saved headers for a URL, or None if it isn't cached """
+        payload_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Mark the payload as used by this run so eviction leaves it alone
+            self.touch(payload_path)
+        except FileNotFoundError:
+            return None
+        return meta
+
+    def get_file(self, url):
+        """
+        Path to an up-to-date cached copy of a URL. New downloads are
+        streamed to disk in chunks rather than held in memory.
+        The file stays in the cache for the rest of the run.
+        """
+        payload_path, meta_path = self._paths(url)
+        meta = self._load_meta(url)
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with requests.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and meta is not None:
+                LOGGER.info(f"HTTP cache hit (304) for {url}")
+                return payload_path
+
+            response.raise_for_status()
+
+            def download(f):
+                size = 0
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+                    size += len(block)
+                return size
+
+            size = self.write_atomic(payload_path, download)
+            meta = {'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')}
+
+        LOGGER.info(f"HTTP cache miss for {url}: downloaded {size} bytes")
+        self.write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        self.evict()
+        return payload_path
+
+    def get(self, url):
+        """
+        Return the body for a URL, reusing the cached copy
+        when the server says it has not changed
+        """
+        with open(self.get_file(url), 'rb') as f:
+            return f.read()
+
+
+HTTP_CACHE = HTTPCache()
+
+
+def cached_http_transport(url):
+    """ Transport for SourceFetcher that goes through the shared HTTP cache """
+    return HTTP_CACHE.get(url)
+
+
+def cached_file_transport(url):
+    """
+    Transport for SourceFetcher that returns the path of the cached
+    copy, so the payload is parsed from disk instead of held as bytes
+    """
+    return HTTP_CACHE.get_file(url)
@@ -2,12 +2,18 @@ from datetime import datetime
 import os
 import pandas as pd
 import utils
+from schema import apply_schema
+from geo_keys import GEO_ID_COL, add_geo_id
+from source_fetcher import SOURCE_URLS, csv_source
+from http_cache import HTTP_CACHE
 
 
 class JHUDataGlobal():
-    def __init__(self, dataset_name, url='not needed'):
-        self.key_col = "state_and_country"
+    def __init__(self, dataset_name, url='not needed', raw_data=None):
+        self.key_col = GEO_ID_COL
         self.url = url
+        # Already fetched CSV (bytes or a cached file path), used instead of the URL when given
+        self.raw_data = raw_data
         self.dataset_name = dataset_name
         self.col_confirmed = f"running_total_{self.dataset_name}"
 
@@ -15,8 +21,15 @@ class JHUDataGlobal():
         self.JH_raw = pd.DataFrame()
 
     def read_initial_data(self):
-        """Read data from URL"""
-        JH_df = pd.read_csv(self.url)
+        """Read data from URL (or pre-fetched data)"""
+        if self.raw_data is None:
+            # Parsed straight from the cached file on disk
+            source = HTTP_CACHE.get_file(self.url)
+        else:
+            source = csv_source(self.raw_data)
+        JH_df = pd.read_csv(source)
+        # The parsed frame is all we need from here on
+        self.raw_data = None
         JH_df.columns = JH_df.columns.str.lower().str.replace(" ", "_")
         JH_df = JH_df.rename(
             columns={
@@ -33,18 +46,14 @@ class JHUDataGlobal():
         """
         Want the data in a stacked format
         """
-        # Stack the dataset
-        df = self.data.copy()
-
         index_cols = [
             "province_or_state",
             "country_or_region",
             "lat",
             "long",
         ]
-        df = df.set_index(index_cols).stack().reset_index(name=self.col_confirmed)
-        df = df.rename(columns={"level_4": "date"})
-        df["date"] = pd.to_datetime(df["date"])
+        # Every other column is a date
+        df = utils.wide_to_long(self.data, index_cols, self.col_confirmed)
         df['data_source'] = 'JHU'
 
         self.country_name_cleanup(df)
@@ -59,29 +68,31 @@ class JHUDataGlobal():
         Some clean up we need to do AND add a RANK field
         """
         df = self.data.copy()
-        # Fill blanks and concat country and state
+        # Fill blanks and key each state/country pair with an integer id
         df["province_or_state"] = df["province_or_state"].fillna("Not Provided")
         df["country_or_region"] = df["country_or_region"].fillna("Not Provided")
 
-        df["state_and_country"] = (
-            df["province_or_state"] + "-" + df["country_or_region"]
-        )
+        df = add_geo_id(df, ["province_or_state", "country_or_region"])
 
         self.data = df
     
     def run(self):
         self.read_initial_data()
         self.stack_initial_dataset()
-        self.clean_data()        
+        self.clean_data()
+        self.data = apply_schema(self.data)
         
         
 
 class JHUCountryCases():
-    def __init__(self):
-        url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv"
+    def __init__(self, raw_data=None):
+        url = SOURCE_URLS['jhu_cases']
         self.dataset_name = 'cases'
         data_obj = JHUDataGlobal(url=url,
-                        dataset_name=self.dataset_name)
+                        dataset_name=self.dataset_name,
+                        raw_data=raw_data)
+        # data_obj frees the bytes once they are parsed
+        del raw_data
         data_obj.run()
 
         enhanced = utils.AddDailyFields(data_obj=data_obj)
@@ -89,11 +100,14 @@ class JHUCountryCases():
         self.data = enhanced.data
         
 class JHUCountryDeaths():
-    def __init__(self):
-        url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv"
+    def __init__(self, raw_data=None):
+        url = SOURCE_URLS['jhu_deaths']
         self.dataset_name = 'deaths'
         data_obj = JHUDataGlobal(url=url,
-                        dataset_name=self.dataset_name)
+                        dataset_name=self.dataset_name,
+                        raw_data=raw_data)
+        # data_obj frees the bytes once they are parsed
+        del raw_data
         data_obj.run()
 
         enhanced = utils.AddDailyFields(data_obj=data_obj)
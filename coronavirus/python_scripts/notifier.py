@@ -0,0 +1,157 @@
+"""
+Background notifications (Slack by default).
+Messages are queued and delivered by a worker thread in batches,
+with a timeout and retries on every request, so sending a status
+message never slows down or hangs the refresh. Anything still
+queued is flushed when the process exits.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import requests
+from config_corona import ConfigCorona
+
+LOGGER = logging.getLogger()
+
+
+class SlackWebhookSink():
+    """ Posts a batch of messages to a Slack incoming webhook as one message """
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, texts):
+        response = requests.post(self.url,
+                                 data=json.dumps({'text': '\n'.join(texts)}),
+                                 headers={'Content-Type': 'application/json'},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+
+
+class LogSink():
+    """ Fallback when no webhook is configured: messages only go to the log """
+    def send(self, texts):
+        for text in texts:
+            LOGGER.info(f"Notification: {text}")
+
+
+def default_sink():
+    """ Slack sink from config_corona.yaml, read once when the first batch goes out """
+    try:
+        return SlackWebhookSink(ConfigCorona().slack_url)
+    except Exception as e:
+        LOGGER.warning(f"Slack is not configured ({e}) - notifications will only be logged")
+        return LogSink()
+
+
+class Notifier():
+    """
+    Queue of messages delivered by a daemon thread.
+    send() never blocks; messages that arrive within batch_window
+    of each other go out together (up to max_batch per request).
+    """
+    def __init__(self, sink=None, retries=3, backoff=1.0, batch_window=0.5,
+                 max_batch=20, max_queue=1000, flush_timeout=15):
+        # sink: any object with send(list_of_texts); built from config when None
+        self.sink = sink
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.flush_timeout = flush_timeout
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        """ Start the worker thread (again, in a forked child) if needed """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+            self._thread.start()
+
+    def send(self, text):
+        """ Queue a message and return immediately """
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(str(text))
+        except queue.Full:
+            LOGGER.warning(f"Notification queue full - dropping: {text}")
+
+    def flush(self, timeout=None):
+        """
+        Wait (up to timeout seconds) for everything queued so far to be
+        delivered. Returns False if it timed out.
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(self.flush_timeout if timeout is None else timeout)
+
+    def close(self):
+        """ Flush on exit; gives up after flush_timeout so exit can't hang """
+        if not self.flush(self.flush_timeout):
+            LOGGER.warning("Timed out delivering notifications on exit")
+
+    def _run(self):
+        while True:
+            batch = []
+            markers = []
+            item = self._queue.get()
+
+            # Collect whatever else arrives within the batch window
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                    # A flush marker ends the batch so flush() returns promptly
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._deliver(batch)
+            for marker in markers:
+                marker.set()
+
+    def _deliver(self, batch):
+        """ Send one batch, retrying with exponential backoff """
+        if self.sink is None:
+            self.sink = default_sink()
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.sink.send(batch)
+                LOGGER.info(f"======= Sent {len(batch)} notification(s) =======")
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    LOGGER.warning(f"Dropping {len(batch)} notification(s) after {attempt + 1} attempts: {e}")
+                    return
+                LOGGER.warning(f"Notification failed ({e}), retrying")
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+NOTIFIER = Notifier()
+atexit.register(NOTIFIER.close)
@@ -1,8 +1,11 @@
 from datetime import datetime
-import os
 import pandas as pd
 import utils
-
+from schema import apply_schema
+from geo_keys import GEO_ID_COL, add_geo_id
+from source_fetcher import SOURCE_URLS, csv_source
+from http_cache import HTTP_CACHE
+from ref_data_registry import REF_DATA
 
 class NYTDataStateLevel():
     """
@@ -10,15 +13,24 @@ class NYTDataStateLevel():
     and get it into appropriate format to combine with
     data from JHU
     """
-    def __init__(self, dataset_name='cases'):
+    def __init__(self, dataset_name='cases', raw_data=None):
         self.dataset_name = dataset_name
         self.data = pd.DataFrame()
         self.key_col = 'state_and_county'
+        # Already fetched CSV (bytes or a cached file path), used instead of the URL when given
+        self.raw_data = raw_data
+
+    def source(self, name):
+        """ CSV to read - pre-fetched data or the cached download on disk """
+        if self.raw_data is None:
+            return HTTP_CACHE.get_file(SOURCE_URLS[name])
+        return csv_source(self.raw_data)
         
     def read_data(self):
-        self.data = pd.read_csv('https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv',
+        self.data = pd.read_csv(self.source('nyt_states'),
                 parse_dates=['date'],
                 dtype={'fips':str})
+        self.raw_data = None
         
 
     def initial_clean(self):
@@ -41,23 +53,8 @@ class NYTDataStateLevel():
     def grab_lat_long_from_ref(self):
         
         df = self.data.copy()
-        dirname = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        ref_path = os.path.join(dirname, 'ref_data','ref_table_us_states.csv')
-
-        ref_table = pd.read_csv(ref_path)
-        ref_table.columns = ref_table.columns.str.lower().str.replace(" ", "_")
-
-        df = df.merge(ref_table,
-                how='left',
-                left_on='province_or_state',
-                right_on='state_name')
-
-        df.drop(['state_name','state_code'], 
-                axis=1,
-               inplace=True)
-
-        df = df.rename(columns={'latitude':'lat',
-                          'longitude':'long'})
+        df['lat'] = df['province_or_state'].map(REF_DATA.lookup('us_states', 'latitude'))
+        df['long'] = df['province_or_state'].map(REF_DATA.lookup('us_states', 'longitude'))
         
         self.data = df
         
@@ -67,6 +64,8 @@ class NYTDataStateLevel():
             self.data = self.data.drop('running_total_deaths', axis=1)
         elif self.dataset_name == 'deaths':
             self.data = self.data.drop('running_total_cases', axis=1)
+        elif self.dataset_name == 'cases_and_deaths':
+            pass
         else:
             print("No valid data name given for NYT data")
     
@@ -75,17 +74,27 @@ class NYTDataStateLevel():
         self.initial_clean()
         self.grab_lat_long_from_ref()
         self.keep_specific_metric()
+        self.data = apply_schema(self.data)
 
 class NYTDataCountyLevel(NYTDataStateLevel):
     """
     Pull COUNTY level data from NYT
     """
-    def read_data(self):
-        nyt = pd.read_csv('https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv')
+    def __init__(self, dataset_name='cases', raw_data=None):
+        super().__init__(dataset_name=dataset_name, raw_data=raw_data)
+        self.key_col = GEO_ID_COL
+
+    def convert_types(self, nyt):
         nyt['fips'] = nyt['fips'].fillna('-999').astype(int).astype(str)
         nyt['date'] = pd.to_datetime(nyt['date'])
-        self.data = nyt
-        
+        return nyt
+
+    def read_data(self):
+        nyt = pd.read_csv(self.source('nyt_counties'))
+        # The parsed frame is all we need from here on
+        self.raw_data = None
+        self.data = self.convert_types(nyt)
+
     def initial_clean(self):
         self.data['country_or_region'] = 'US'
         self.data['data_source'] = 'NYT'
@@ -94,7 +103,6 @@ class NYTDataCountyLevel(NYTDataStateLevel):
                                   'cases':'running_total_cases',
                                   'deaths':'running_total_deaths'},
                          inplace=True)
-        self.data['state_and_county'] = self.data['province_or_state'] + "-" + self.data['county']
         
         # Clean up DC for later REF mapping
         self.data.loc[self.data['province_or_state'] == 'District of Columbia', 
@@ -102,19 +110,17 @@ class NYTDataCountyLevel(NYTDataStateLevel):
 
         self.data.loc[self.data['county'] == 'New York City', 'fips'] = '36061'                     
 
-    def grab_lat_long_from_ref(self):
-        FIPS = utils.load_FIPS_data()
+        # Counties are keyed by FIPS, or a state/county id when FIPS is missing
+        self.data = add_geo_id(self.data, ['province_or_state', 'county'], fips_col='fips')
 
-        self.data = self.data.merge(FIPS[['fips','lat','long']],
-                 how='left',
-                 on='fips',
-                 )
+    def grab_lat_long_from_ref(self):
+        self.data['lat'] = self.data['fips'].map(REF_DATA.lookup('fips', 'lat'))
+        self.data['long'] = self.data['fips'].map(REF_DATA.lookup('fips', 'long'))
 
-        
 
 class NYTCountyCases():
     def __init__(self):
-        self.key_col = 'state_and_county'
+        self.key_col = GEO_ID_COL
         self.dataset_name='cases'
         nyt = NYTDataCountyLevel(dataset_name=self.dataset_name)
         nyt.run()
@@ -125,11 +131,29 @@ class NYTCountyCases():
         
 class NYTCountyDeaths():
     def __init__(self):
-        self.key_col = 'state_and_county'
+        self.key_col = GEO_ID_COL
         self.dataset_name='deaths'
         nyt = NYTDataCountyLevel(dataset_name=self.dataset_name)
         nyt.run()
     
         enhanced = utils.AddDailyFields(data_obj=nyt)
         enhanced.create_daily_new_col()
-        self.data = enhanced.data
\ No newline at end of file
+        self.data = enhanced.data
+
+class NYTCountyCasesAndDeaths():
+    """
+    Cases and deaths from a single read of the NYT county file
+    """
+    def __init__(self, raw_data=None):
+        self.key_col = GEO_ID_COL
+        self.dataset_name = 'cases_and_deaths'
+        nyt = NYTDataCountyLevel(dataset_name=self.dataset_name,
+                                 raw_data=raw_data)
+        # nyt frees the bytes once they are parsed
+        del raw_data
+        nyt.run()
+
+        enhanced = utils.AddDailyFields(data_obj=nyt,
+                                        dataset_names=['cases', 'deaths'])
+        enhanced.create_daily_new_col()
+        self.data = enhanced.data
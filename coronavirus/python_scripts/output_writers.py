@@ -0,0 +1,274 @@
+"""
+Writers for the output datasets.
+CSV stays the main format; typed, compressed columnar copies
+(Parquet / Feather) can be written alongside it so downstream
+readers don't have to re-parse dates and re-infer dtypes.
+
+By default each dataset is written as monthly partitions (one file
+per format per month) with a manifest of data hashes. Only partitions
+whose contents changed are rewritten, so both the write I/O of a
+refresh and the files pushed to GitHub grow with the day's changes,
+not with the length of the history. The full CSV is still written
+next to the partitions (COMBINED_CSV) for readers of the old files.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import json
+import hashlib
+import logging
+import pandas as pd
+
+LOGGER = logging.getLogger()
+
+OUTPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'output_data')
+
+# Formats written for every dataset. Columnar formats need pyarrow
+# and are skipped with a warning when it isn't installed.
+OUTPUT_FORMATS = ['csv', 'parquet']
+
+# Write monthly partitions (the layout pushed to GitHub) instead of
+# one full file per format
+PARTITIONED_OUTPUT = True
+PARTITION_FREQ = 'M'
+MANIFEST_NAME = 'manifest.json'
+
+# Keep writing output_dir/name.csv alongside the partitions, for anyone
+# still reading the single-file CSVs (e.g. by their raw GitHub URL)
+COMBINED_CSV = True
+
+
+def pyarrow_available():
+    """ True if pyarrow can be imported """
+    try:
+        import pyarrow  # noqa: F401 pylint: disable=import-outside-toplevel, unused-import
+        return True
+    except ImportError:
+        return False
+
+
+class CSVWriter():
+    """ Plain CSV, the format pushed to GitHub """
+    extension = 'csv'
+    needs_pyarrow = False
+
+    def write(self, df, path):
+        df.to_csv(path, index=False)
+
+    def read(self, path):
+        return pd.read_csv(path, parse_dates=['date'])
+
+
+class ParquetWriter():
+    """ Snappy-compressed Parquet, keeps categoricals and datetimes """
+    extension = 'parquet'
+    needs_pyarrow = True
+
+    def write(self, df, path):
+        df.to_parquet(path, index=False, compression='snappy')
+
+    def read(self, path):
+        return pd.read_parquet(path)
+
+
+class FeatherWriter():
+    """ zstd-compressed Feather (Arrow IPC), fastest to load back """
+    extension = 'feather'
+    needs_pyarrow = True
+
+    def write(self, df, path):
+        from pyarrow import feather  # pylint: disable=import-outside-toplevel
+        feather.write_feather(df.reset_index(drop=True), path, compression='zstd')
+
+    def read(self, path):
+        return pd.read_feather(path)
+
+
+WRITERS = {
+    'csv': CSVWriter(),
+    'parquet': ParquetWriter(),
+    'feather': FeatherWriter(),
+}
+
+
+def output_path(name, fmt='csv', output_dir=None):
+    """ Full path of an output dataset in a given format """
+    output_dir = output_dir or OUTPUT_DIR
+    return os.path.join(output_dir, f'{name}.{WRITERS[fmt].extension}')
+
+
+def usable_formats(formats, name):
+    """ formats, minus the columnar ones when pyarrow isn't installed """
+    has_pyarrow = pyarrow_available()
+    usable = []
+    for fmt in formats:
+        if WRITERS[fmt].needs_pyarrow and not has_pyarrow:
+            LOGGER.warning(f"pyarrow is not installed - skipping {fmt} output for {name}")
+            continue
+        usable.append(fmt)
+    return usable
+
+
+def write_output(df, name, formats=None, output_dir=None):
+    """
+    Write df once per format: as partitions under output_dir/name/
+    (only the changed ones) when PARTITIONED_OUTPUT is on, otherwise
+    as output_dir/name.<ext>
+    Returns the list of files written (or removed)
+    """
+    formats = usable_formats(formats or OUTPUT_FORMATS, name)
+    if PARTITIONED_OUTPUT:
+        changed = write_partitions(df, name, formats=formats, output_dir=output_dir)
+
+        # The combined CSV only needs rewriting when a partition changed
+        path = output_path(name, 'csv', output_dir)
+        if COMBINED_CSV and (changed or not os.path.exists(path)):
+            WRITERS['csv'].write(df, path)
+            LOGGER.info(f"Wrote {path}")
+            changed.append(path)
+        return changed
+
+    written = []
+    for fmt in formats:
+        path = output_path(name, fmt, output_dir)
+        WRITERS[fmt].write(df, path)
+        LOGGER.info(f"Wrote {path}")
+        written.append(path)
+
+    return written
+
+
+def partition_dir(name, output_dir=None):
+    """ Folder holding a dataset's partitions and manifest """
+    return os.path.join(output_dir or OUTPUT_DIR, name)
+
+
+def load_manifest(name, output_dir=None):
+    """ Saved manifest for a dataset, or an empty one """
+    path = os.path.join(partition_dir(name, output_dir), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def partition_hash(df):
+    """
+    Hash of a partition's column names and values. Computed from the
+    data (no CSV formatting needed), so unchanged partitions are
+    skipped without being serialized. It is not a hash of the files
+    and depends on the dtypes as well as the values.
+    """
+    digest = hashlib.sha256(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def partition_files(saved):
+    """ Files listed for a partition in a manifest """
+    # Manifests written before Parquet partitions had a single CSV 'file'
+    return saved.get('files') or [saved['file']]
+
+
+def write_partitions(df, name, formats=('csv',), freq=PARTITION_FREQ, output_dir=None):
+    """
+    Write df as one file per format per period of `date` (monthly by
+    default), skipping partitions whose data hash matches the manifest
+    and removing partitions that no longer exist.
+    Returns the files that were written or removed.
+    """
+    folder = partition_dir(name, output_dir)
+    os.makedirs(folder, exist_ok=True)
+    previous = load_manifest(name, output_dir)['partitions']
+
+    # Rows without a date belong to no period, so groupby leaves them out
+    undated = int(df['date'].isna().sum())
+    if undated:
+        LOGGER.warning(f"{name}: {undated} rows have no date and are left out of the partitions")
+
+    partitions = {}
+    changed = []
+    for period, part in df.groupby(df['date'].dt.to_period(freq), sort=True):
+        digest = partition_hash(part)
+        files = [f'{name}_{period}.{WRITERS[fmt].extension}' for fmt in formats]
+        partitions[str(period)] = {'files': files, 'data_hash': digest, 'rows': len(part)}
+
+        saved = previous.get(str(period))
+        if (saved is not None and saved.get('data_hash') == digest and partition_files(saved) == files
+                and all(os.path.exists(os.path.join(folder, filename)) for filename in files)):
+            continue
+
+        for fmt, filename in zip(formats, files):
+            path = os.path.join(folder, filename)
+            WRITERS[fmt].write(part, path)
+            changed.append(path)
+
+    # Partitions (or formats) that are gone
+    current_files = {filename for saved in partitions.values() for filename in saved['files']}
+    for saved in previous.values():
+        for filename in partition_files(saved):
+            if filename not in current_files:
+                path = os.path.join(folder, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+                changed.append(path)
+
+    manifest = {'dataset': name, 'freq': freq, 'columns': list(df.columns), 'partitions': partitions}
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    if changed or not os.path.exists(manifest_path):
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        changed.append(manifest_path)
+
+    LOGGER.info(f"{name}: {len(partitions)} partitions, {len(changed)} files changed")
+    return changed
+
+
+def read_partitions(name, output_dir=None):
+    """
+    Reassemble a dataset from its partitions (None if there are none),
+    from the Parquet files when every partition has one
+    """
+    manifest = load_manifest(name, output_dir)
+    if not manifest['partitions']:
+        return None
+
+    folder = partition_dir(name, output_dir)
+    files = [partition_files(manifest['partitions'][period]) for period in sorted(manifest['partitions'])]
+
+    fmt = 'csv'
+    parquet_ext = '.' + WRITERS['parquet'].extension
+    if pyarrow_available() and all(any(f.endswith(parquet_ext) for f in part_files) for part_files in files):
+        fmt = 'parquet'
+
+    extension = '.' + WRITERS[fmt].extension
+    parts = [WRITERS[fmt].read(os.path.join(folder, next(f for f in part_files if f.endswith(extension))))
+             for part_files in files]
+    return pd.concat(parts, axis=0, ignore_index=True)
+
+
+def read_output(name, output_dir=None):
+    """
+    Load a previously written dataset: from its partitions when there
+    are any, otherwise from the most recently written full file
+    (columnar copies are written last, so they win within a run).
+    Returns None if nothing exists.
+    """
+    partitioned = read_partitions(name, output_dir)
+    if partitioned is not None:
+        LOGGER.info(f"Reading previous output from the {name} partitions")
+        return partitioned
+
+    has_pyarrow = pyarrow_available()
+    candidates = []
+    for fmt, writer in WRITERS.items():
+        path = output_path(name, fmt, output_dir)
+        if os.path.exists(path) and (has_pyarrow or not writer.needs_pyarrow):
+            candidates.append((os.path.getmtime(path), fmt, path))
+
+    if not candidates:
+        return None
+
+    _, fmt, path = max(candidates)
+    LOGGER.info(f"Reading previous output from {path}")
+    return WRITERS[fmt].read(path)
@@ -0,0 +1,120 @@
+"""
+Per-stage timing and memory for a refresh.
+Each stage records wall time, CPU time, the rise in peak RSS and the
+rows/memory of the frame it works on, and the whole run is written
+out as a JSON report so slow or growing stages are easy to spot.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import sys
+import json
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOGGER = logging.getLogger()
+
+REPORT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'run_reports')
+
+
+def peak_rss_bytes():
+    """ Peak resident memory of this process so far, or None where unavailable """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def frame_stats(obj):
+    """ (rows, bytes) of obj.data when it is a DataFrame """
+    df = getattr(obj, 'data', None)
+    if not isinstance(df, pd.DataFrame):
+        return None, None
+    # Shallow memory - the schema keeps strings categorical, so this is close
+    return len(df), int(df.memory_usage(index=True).sum())
+
+
+class RunProfiler():
+    """ Collects one record per stage for the current run """
+    def __init__(self):
+        self.started = datetime.now()
+        self.records = []
+
+    def reset(self):
+        self.started = datetime.now()
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, obj=None, **info):
+        """
+        Time the block as stage `name`. obj.data is measured
+        before and after when obj is given. Yields a dict the block
+        can add extra fields to.
+        """
+        rows_in, bytes_in = frame_stats(obj)
+        peak_before = peak_rss_bytes()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        extra = dict(info)
+        try:
+            yield extra
+        finally:
+            rows_out, bytes_out = frame_stats(obj)
+            peak_after = peak_rss_bytes()
+            record = {
+                'stage': name,
+                'wall_seconds': round(time.perf_counter() - wall, 4),
+                'cpu_seconds': round(time.process_time() - cpu, 4),
+                'peak_rss_delta_bytes': None if peak_before is None else peak_after - peak_before,
+                'rows_in': rows_in,
+                'rows_out': rows_out,
+                'frame_bytes_in': bytes_in,
+                'frame_bytes_out': bytes_out,
+            }
+            record.update(extra)
+            self.records.append(record)
+            LOGGER.info(f"{name} took {record['wall_seconds']:.2f}s")
+
+    def add_records(self, records):
+        """ Merge in records collected elsewhere (e.g. a worker process) """
+        self.records.extend(records)
+
+    def report(self):
+        """ The whole run as a dict """
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'total_wall_seconds': round((datetime.now() - self.started).total_seconds(), 4),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': self.records,
+        }
+
+    def write_report(self, report_dir=REPORT_DIR):
+        """ Save the run report as JSON and return its path """
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, f"run_report_{self.started:%Y-%m-%d_%H%M%S}.json")
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        LOGGER.info(f"Wrote run report to {path}")
+        return path
+
+    def summary(self, top=5):
+        """ Short text summary (total time and slowest stages) for notifications """
+        report = self.report()
+        slowest = sorted(self.records, key=lambda r: r['wall_seconds'], reverse=True)[:top]
+        lines = [f"Total {report['total_wall_seconds']:.1f}s"]
+        if report['peak_rss_bytes'] is not None:
+            lines[0] += f", peak RSS {report['peak_rss_bytes'] / 1024 ** 2:.0f} MB"
+        lines += [f"{r['stage']}: {r['wall_seconds']:.1f}s" for r in slowest]
+        return '\n'.join(lines)
+
+
+PROFILER = RunProfiler()
@@ -0,0 +1,133 @@
+"""
+Central place to load the reference tables in ref_data/.
+Each table is read once per process with explicit dtypes and
+normalized column names, and re-read only when the file changes.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import logging
+import threading
+import pandas as pd
+
+LOGGER = logging.getLogger()
+
+REF_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'ref_data')
+
+# filename, dtypes (after column names are normalized) and key column(s)
+REF_TABLES = {
+    'us_states': {
+        'filename': 'ref_table_us_states.csv',
+        'dtype': {'state_code': str, 'state_name': str,
+                  'latitude': float, 'longitude': float},
+        'key': 'state_name',
+    },
+    'us_state_population': {
+        'filename': 'ref_us_state_population.csv',
+        'dtype': {'state': str, 'us_state_pop_2019_estimate': float},
+        'key': 'state',
+    },
+    'fips': {
+        'filename': 'FIPS_ref_data.csv',
+        'dtype': {'fips': str, 'state': str, 'name': str,
+                  'lat': float, 'long': float},
+        'key': 'fips',
+    },
+    'county_zip': {
+        'filename': 'county_to_zip_ref.csv',
+        'dtype': {'state_code': str, 'county': str, 'lat': float, 'long': float,
+                  'test_zipcode': str, 'test_county': str, 'test_state': str,
+                  'test_population': str, 'test_population_density': str},
+        'key': ['state_code', 'county'],
+    },
+    'country_population': {
+        'filename': 'ref_country_population.csv',
+        'dtype': {'country_name': str, 'country_code_3': str,
+                  'country_population_2018': float},
+        'key': 'country_code_3',
+    },
+    'median_age_country': {
+        'filename': 'ref_median_age_country.csv',
+        'dtype': {'country': str, 'rank': float, 'median_years': float,
+                  'male_years': float, 'female_years': float,
+                  'country_code_2': str, 'country_code_3': str},
+        'key': 'country_code_3',
+    },
+    'causes_of_death': {
+        'filename': 'ref_causes_of_death.csv',
+        'dtype': {'country': str, 'cause_of_death': str,
+                  'year': int, 'deaths': float},
+        'key': ['country', 'cause_of_death'],
+    },
+}
+
+
+def normalize_columns(columns):
+    """ Lower case and underscores, the way the rest of the code expects """
+    return columns.str.lower().str.replace(' ', '_')
+
+
+class RefDataRegistry():
+    """
+    Loads each reference table once and keeps it (plus any
+    key -> column lookups built from it) until the file's mtime changes
+    """
+    def __init__(self, ref_dir=REF_DIR, tables=None):
+        self.ref_dir = ref_dir
+        self.tables = tables or REF_TABLES
+        self._cache = {}
+        self._lookups = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        """ Full path to a reference table """
+        return os.path.join(self.ref_dir, self.tables[name]['filename'])
+
+    def load(self, name):
+        """ Read a table from disk """
+        spec = self.tables[name]
+        path = self.path(name)
+
+        # dtypes are keyed on normalized names, so map them back to the raw header
+        raw_columns = pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns
+        dtype = {raw: spec['dtype'][col]
+                 for raw, col in zip(raw_columns, normalize_columns(raw_columns))
+                 if col in spec['dtype']}
+
+        df = pd.read_csv(path, encoding='utf-8-sig', dtype=dtype)
+        df.columns = normalize_columns(df.columns)
+
+        # Keys are unique so lookups/maps are well defined
+        key = spec['key']
+        df = df.drop_duplicates(key if isinstance(key, list) else [key])
+        LOGGER.info(f"Loaded reference table {name} ({len(df)} rows)")
+        return df
+
+    def _table(self, name):
+        """ Cached table, reloaded if the file changed """
+        mtime = os.path.getmtime(self.path(name))
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached is None or cached[0] != mtime:
+                self._cache[name] = (mtime, self.load(name))
+                self._lookups = {k: v for k, v in self._lookups.items() if k[0] != name}
+            return self._cache[name][1]
+
+    def get(self, name):
+        """ A copy of a reference table, safe for callers to modify """
+        return self._table(name).copy()
+
+    def lookup(self, name, column):
+        """
+        `column` (a name, or a list of names) indexed by the table's key,
+        for use with Series.map / DataFrame.join
+        """
+        df = self._table(name)
+        lookup_key = (name, tuple(column) if isinstance(column, list) else column)
+        with self._lock:
+            if lookup_key not in self._lookups:
+                self._lookups[lookup_key] = df.set_index(self.tables[name]['key'])[column]
+            return self._lookups[lookup_key]
+
+
+REF_DATA = RefDataRegistry()
@@ -0,0 +1,130 @@
+"""
+Refresh the reference tables that are scraped from the web.
+This is run by hand, NOT as part of the daily refresh:
+
+    python refresh_ref_data.py
+    python refresh_ref_data.py --tables us_state_population
+
+Each scrape is saved as a dated snapshot in ref_data/snapshots/ and
+replaces the current table in ref_data/, which is all the main
+pipeline ever reads. Country names the daily refresh has resolved
+since the last run are folded into ref_country_code_lookup.csv.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import argparse
+import logging
+from datetime import datetime
+import pandas as pd
+from country_codes import get_resolver
+from ref_data_registry import REF_DATA, REF_DIR
+
+LOGGER = logging.getLogger()
+
+SNAPSHOT_DIR = os.path.join(REF_DIR, 'snapshots')
+
+
+def save_snapshot(df, name):
+    """
+    Write a dated snapshot of a reference table and make it
+    the current version read by the pipeline
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    current_file = REF_DATA.path(name)
+    base = os.path.splitext(os.path.basename(current_file))[0]
+    today = datetime.today().strftime('%Y-%m-%d')
+    snapshot_file = os.path.join(SNAPSHOT_DIR, f'{base}_{today}.csv')
+
+    df.to_csv(snapshot_file, index=False)
+    df.to_csv(current_file, index=False)
+    LOGGER.info(f"Saved {name} snapshot to {snapshot_file}")
+
+
+def pull_median_country_age():
+    """
+    Pull median age by country data from Wikipedia
+    """
+    age_wiki = pd.read_html('https://en.wikipedia.org/wiki/List_of_countries_by_median_age')
+    df = age_wiki[0]
+    df.columns = df.columns.str.lower()
+    df.columns = ['country','rank','median_years','male_years','female_years']
+
+    # Add country codes
+    df = get_resolver().add_codes(df, 'country')
+
+    df.loc[df['country'] == 'Virgin Islands', 'country_code_2'] = 'VG'
+    df.loc[df['country'] == 'Virgin Islands', 'country_code_3'] = 'VGB'
+
+    df.loc[df['country'] == 'Curacao', 'country_code_2'] = 'CW'
+    df.loc[df['country'] == 'Curacao', 'country_code_3'] = 'CUW'
+
+    df.loc[df['country'] == 'Sint Maarten', 'country_code_2'] = 'SX'
+    df.loc[df['country'] == 'Sint Maarten', 'country_code_3'] = 'SXM'
+
+    df.loc[df['country'] == 'Kosovo', 'country_code_2'] = 'XK'
+    df.loc[df['country'] == 'Kosovo', 'country_code_3'] = 'XKX'
+
+    df.loc[df['country'] == 'Niger', 'country_code_2'] = 'NE'
+    df.loc[df['country'] == 'Niger', 'country_code_3'] = 'NER'
+
+    df = df.drop_duplicates('country_code_3')
+
+    save_snapshot(df, 'median_age_country')
+    return df
+
+def pull_US_state_population_data():
+    """
+    Scrapes a Wikipedia page to pull US state population data
+    """
+    wiki = pd.read_html('https://simple.wikipedia.org/wiki/List_of_U.S._states_by_population')
+    df = wiki[0]
+    df.columns = df.columns.str.lower().str.replace(' ','_')
+    df = df[['state','population_estimate,_july_1,_2019[2]']]
+    df.columns = ['state','us_state_pop_2019_estimate']
+
+    df.loc[df['state'] == 'District of Columbia', 'state'] = 'Washington DC'
+    df.loc[df['state'] == 'U.S. Virgin Islands', 'state'] = 'Virgin Islands'
+
+    save_snapshot(df, 'us_state_population')
+    return df
+
+def create_FIPS_ref_data():
+    """
+    Load up a FIPS ref table from GitHub
+    """
+    FIPS = pd.read_json('https://raw.githubusercontent.com/josh-byster/fips_lat_long/master/fips_map.json')
+    FIPS = FIPS.transpose().reset_index()
+    FIPS = FIPS.rename(columns={'index':'fips'})
+    FIPS['fips'] = FIPS['fips'].astype(str)
+
+    save_snapshot(FIPS, 'fips')
+    return FIPS
+
+
+SCRAPERS = {
+    'median_age_country': pull_median_country_age,
+    'us_state_population': pull_US_state_population_data,
+    'fips': create_FIPS_ref_data,
+}
+
+
+if __name__ == '__main__':
+    LOGGER.setLevel(logging.INFO)
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    LOGGER.addHandler(ch)
+
+    parser = argparse.ArgumentParser(description='Re-scrape reference tables into ref_data/')
+    parser.add_argument('--tables',
+                        nargs='+',
+                        choices=list(SCRAPERS),
+                        default=list(SCRAPERS),
+                        help='Which reference tables to refresh (default: all)')
+    args = parser.parse_args()
+
+    for table in args.tables:
+        LOGGER.info(f"Refreshing {table}")
+        SCRAPERS[table]()
+
+    # The daily refresh only caches new names; this is where they get saved
+    get_resolver().save_to_ref()
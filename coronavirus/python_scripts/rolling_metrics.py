@@ -0,0 +1,123 @@
+"""
+Rolling epidemiological metrics per geography: trailing sums and
+averages, week-over-week growth and doubling time.
+Everything comes from cumulative sums over the frame sorted by
+(geography, date), with window edges found by searchsorted, so the
+whole frame is done in one vectorized pass however many
+geographies it has.
+"""
+# pylint: disable=invalid-name, line-too-long
+import numpy as np
+import pandas as pd
+from schema import count_values
+
+
+def metric_name(col):
+    """ daily_new_cases -> new_cases, running_total_cases -> cases """
+    return col.replace('daily_', '').replace('running_total_', '')
+
+
+class RollingMetrics():
+    """
+    Which metrics to build. Windows are calendar days, so a geography
+    with missing days still gets the right window; windows that reach
+    back before a geography's first date are left empty (NaN).
+    """
+    def __init__(self,
+                 value_cols=('daily_new_cases', 'daily_new_deaths'),
+                 windows=(7,),
+                 growth_window=7,
+                 doubling_col='running_total_cases',
+                 doubling_window=7):
+        self.value_cols = list(value_cols)
+        self.windows = list(windows)
+        self.growth_window = growth_window
+        self.doubling_col = doubling_col
+        self.doubling_window = doubling_window
+
+    def columns(self):
+        """ Names of the columns compute() returns, in order """
+        cols = []
+        for col in self.value_cols:
+            name = metric_name(col)
+            for window in self.windows:
+                cols += [f'{name}_{window}d_sum', f'{name}_{window}d_avg']
+            if self.growth_window:
+                cols.append(f'{name}_wow_growth')
+        if self.doubling_col:
+            cols.append(f'{metric_name(self.doubling_col)}_doubling_days')
+        return cols
+
+    def compute(self, df, keys, date_col='date'):
+        """
+        {column: array} in df's row order. keys identifies each row's
+        geography (e.g. geo ids); a geography has one row per date.
+        """
+        n = len(df)
+        if n == 0:
+            return {col: np.array([], dtype=float) for col in self.columns()}
+
+        key_codes = pd.factorize(keys)[0]
+        days = df[date_col].to_numpy(dtype='datetime64[D]').astype(np.int64)
+        order = np.lexsort((days, key_codes))
+        sorted_keys = key_codes[order]
+        sorted_days = days[order]
+
+        # One sortable integer per row: each key gets a block wide enough
+        # that looking back the longest window never leaves it
+        lookback = max(self.windows + [2 * (self.growth_window or 0), self.doubling_window or 0])
+        offset = sorted_days - sorted_days.min() + lookback
+        block = int(offset.max()) + 1
+        position = sorted_keys.astype(np.int64) * block + offset
+
+        new_key = np.ones(n, dtype=bool)
+        new_key[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        first_row = np.maximum.accumulate(np.where(new_key, np.arange(n), 0))
+        first_day = sorted_days[first_row]
+
+        def window_sum(cumulative, start_back, end_back):
+            """ Sum over [day - start_back, day - end_back] for every row """
+            start = np.searchsorted(position, position - start_back, side='left')
+            end = np.searchsorted(position, position - end_back, side='right')
+            total = (cumulative[end] - cumulative[start]).astype(float)
+            return np.where(first_day <= sorted_days - start_back, total, np.nan)
+
+        sorted_results = {}
+        for col in self.value_cols:
+            name = metric_name(col)
+            # Counts are whole numbers, so integer sums keep the results exact
+            values = np.nan_to_num(count_values(df[col])[order]).astype(np.int64)
+            cumulative = np.concatenate([[0], np.cumsum(values)])
+
+            for window in self.windows:
+                total = window_sum(cumulative, window - 1, 0)
+                sorted_results[f'{name}_{window}d_sum'] = total
+                sorted_results[f'{name}_{window}d_avg'] = np.round(total / window, 3)
+
+            if self.growth_window:
+                week = self.growth_window
+                this_week = window_sum(cumulative, week - 1, 0)
+                last_week = window_sum(cumulative, 2 * week - 1, week)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    growth = np.where(last_week > 0, this_week / last_week - 1, np.nan)
+                sorted_results[f'{name}_wow_growth'] = np.round(growth, 4)
+
+        if self.doubling_col:
+            totals = count_values(df[self.doubling_col])[order]
+            # Latest row of the same geography on or before doubling_window days ago
+            before = np.searchsorted(position, position - self.doubling_window, side='right') - 1
+            valid = (before >= 0) & (sorted_keys[np.maximum(before, 0)] == sorted_keys)
+            then = np.where(valid, totals[np.maximum(before, 0)], np.nan)
+            elapsed = sorted_days - sorted_days[np.maximum(before, 0)]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = np.log(totals / then) / elapsed
+                doubling = np.where(valid & (then > 0) & (totals > then), np.log(2) / rate, np.nan)
+            sorted_results[f'{metric_name(self.doubling_col)}_doubling_days'] = np.round(doubling, 2)
+
+        results = {}
+        for col, sorted_values in sorted_results.items():
+            values = np.empty(n, dtype=float)
+            values[order] = sorted_values
+            results[col] = values
+        return results
@@ -1,9 +1,17 @@
 from datetime import datetime
 import os
+import pickle
+import argparse
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from data_aggregators import (GlobalDataJHU, USDataNYT, CauseOfDeath, JHUCountryAggregate)
 from utils import push_output_to_github, send_slack
+from source_fetcher import SourceFetcher
+from http_cache import cached_file_transport
+from stage_cache import STAGE_CACHE
+from profiling import PROFILER
 
 LOGGER = logging.getLogger()
 LOGGER.setLevel(logging.DEBUG)
@@ -19,24 +27,148 @@ ch.setFormatter(formatter)
 LOGGER.addHandler(ch)
 
 
-send_slack("START OF CORONA SCRIPT")
-try:
-    # NYT section
-    NYT = USDataNYT()
+def run_nyt_branch(options):
+    """
+    NYT US data and the cause of death comparison built from it.
+    Results are written to output_data.
+    """
+    STAGE_CACHE.enabled = options['stage_cache']
+
+    # The county file is parsed from the HTTP cache on disk rather than held as bytes
+    with PROFILER.stage('SourceFetcher.fetch.nyt'):
+        sources = SourceFetcher(names=['nyt_counties'], transport=cached_file_transport).fetch()
+
+    NYT = USDataNYT(sources=sources, incremental=options['incremental'])
     NYT.run()
 
     COD = CauseOfDeath(NYT)
     COD.run()
 
-    # JHU section
-    JHU = GlobalDataJHU()
+
+def run_jhu_branch(options):
+    """
+    JHU global data and the country level aggregate built from it.
+    Results are written to output_data.
+    """
+    STAGE_CACHE.enabled = options['stage_cache']
+
+    with PROFILER.stage('SourceFetcher.fetch.jhu'):
+        sources = SourceFetcher(names=['jhu_cases', 'jhu_deaths'], transport=cached_file_transport).fetch()
+
+    JHU = GlobalDataJHU(sources=sources, incremental=options['incremental'])
     JHU.run()
 
     country_agg = JHUCountryAggregate(JHU)
     country_agg.run()
 
-    push_output_to_github()
-    send_slack("CORONA script ran successfully")
-except Exception as e:
-    send_slack("============ ERROR WITH CORONA SCRIPT ============")
-    send_slack(f"{e}")
\ No newline at end of file
+
+BRANCHES = {
+    'NYT': run_nyt_branch,
+    'JHU': run_jhu_branch,
+}
+
+
+def run_branch(name, options):
+    """
+    Run one branch and return (profile records, exception or None),
+    so a branch that fails still reports the stages it got through
+    """
+    first_record = len(PROFILER.records)
+    error = None
+    try:
+        BRANCHES[name](options)
+    except Exception as e:
+        LOGGER.exception(f"{name} branch failed")
+        error = e
+        try:
+            pickle.dumps(error)
+        except Exception:
+            # It has to travel back from a worker process
+            error = RuntimeError(f"{type(e).__name__}: {e}")
+    return PROFILER.records[first_record:], error
+
+
+def run_branches(options, parallel=True):
+    """
+    Run every branch, each in its own process when parallel.
+    Returns {branch: exception} for the branches that failed.
+    """
+    failures = {}
+    if not parallel:
+        # Records land in this process's PROFILER directly
+        for name in BRANCHES:
+            _, error = run_branch(name, options)
+            if error is not None:
+                failures[name] = error
+        return failures
+
+    # Spawned workers start clean instead of forking this process
+    # along with the Slack notifier's thread and its locks
+    with ProcessPoolExecutor(max_workers=len(BRANCHES),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {name: pool.submit(run_branch, name, options) for name in BRANCHES}
+        for name, future in futures.items():
+            try:
+                records, error = future.result()
+            except Exception as e:
+                # The worker itself died, so there are no records to keep
+                LOGGER.exception(f"{name} branch failed")
+                failures[name] = e
+                continue
+
+            PROFILER.add_records(records)
+            if error is not None:
+                failures[name] = error
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the coronavirus output data')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only process dates newer than the saved output files')
+    parser.add_argument('--no-stage-cache',
+                        action='store_true',
+                        help='Rerun every stage without reading or writing the stage cache')
+    parser.add_argument('--clear-stage-cache',
+                        action='store_true',
+                        help='Empty the stage cache first so every stage is recomputed')
+    parser.add_argument('--report-summary',
+                        action='store_true',
+                        help='Add the slowest stages from the run report to the final Slack message')
+    parser.add_argument('--serial',
+                        action='store_true',
+                        help='Run the JHU and NYT branches one after the other in this process')
+    args = parser.parse_args()
+
+    if args.clear_stage_cache:
+        STAGE_CACHE.clear()
+
+    options = {'incremental': args.incremental,
+               'stage_cache': not args.no_stage_cache}
+
+    send_slack("START OF CORONA SCRIPT")
+    try:
+        failures = run_branches(options, parallel=not args.serial)
+        if failures:
+            PROFILER.write_report()
+            send_slack("============ ERROR WITH CORONA SCRIPT ============")
+            for name, e in failures.items():
+                send_slack(f"{name}: {e}")
+            succeeded = [name for name in BRANCHES if name not in failures]
+            if succeeded:
+                send_slack(f"Output from {', '.join(succeeded)} was written to output_data but NOT pushed")
+        else:
+            with PROFILER.stage('push_output_to_github'):
+                push_output_to_github()
+
+            PROFILER.write_report()
+            message = "CORONA script ran successfully"
+            if args.report_summary:
+                message += "\n" + PROFILER.summary()
+            send_slack(message)
+    except Exception as e:
+        PROFILER.write_report()
+        send_slack("============ ERROR WITH CORONA SCRIPT ============")
+        send_slack(f"{e}")
@@ -0,0 +1,74 @@
+"""
+Compact dtypes for the long-format frames.
+Repeated strings (geographies, sources, keys) become categoricals
+and counts become nullable integers, applied the same way at
+every stage so merges and groupbys keep working on compact data.
+"""
+# pylint: disable=invalid-name, line-too-long
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLS = [
+    'province_or_state',
+    'country_or_region',
+    'county',
+    'data_source',
+    'fips',
+    'state_and_country',
+    'state_and_county',
+    'state_code',
+    'country_code_2',
+    'country_code_3',
+]
+
+COUNT_COLS = [
+    'running_total_cases',
+    'running_total_cases_prev_day',
+    'daily_new_cases',
+    'running_total_deaths',
+    'running_total_deaths_prev_day',
+    'daily_new_deaths',
+    'country_running_agg',
+]
+
+
+def is_categorical(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def apply_schema(df):
+    """
+    Convert whichever schema columns df has to their compact dtype.
+    Any other column that ended up categorical is turned back
+    into a plain column so it behaves like a normal value.
+    """
+    for col in df.columns:
+        if col in CATEGORICAL_COLS:
+            if not is_categorical(df[col]):
+                df[col] = df[col].astype('category')
+        elif col in COUNT_COLS:
+            if df[col].dtype != 'Int64':
+                df[col] = df[col].astype(float).round().astype('Int64')
+        elif is_categorical(df[col]):
+            df[col] = np.asarray(df[col])
+
+    return df
+
+
+def map_values(keys, mapping):
+    """
+    Series.map that looks each distinct key up once and always
+    returns a plain column, even when keys is categorical
+    """
+    if not is_categorical(keys):
+        return keys.map(mapping)
+
+    mapped = pd.Series(keys.cat.categories).map(mapping)
+    # Missing keys have code -1, which reindexes to NaN
+    values = mapped.reindex(keys.cat.codes).to_numpy()
+    return pd.Series(values, index=keys.index)
+
+
+def count_values(series):
+    """ Counts as a float array (NaN for missing) for NumPy work """
+    return series.to_numpy(dtype=float, na_value=np.nan)
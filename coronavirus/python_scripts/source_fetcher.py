@@ -0,0 +1,81 @@
+"""
+Download the remote CSV sources concurrently so a refresh
+waits on the slowest download rather than the sum of them
+"""
+# pylint: disable=invalid-name, line-too-long
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_cache import cached_http_transport
+
+LOGGER = logging.getLogger()
+
+SOURCE_URLS = {
+    'jhu_cases': "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv",
+    'jhu_deaths': "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv",
+    'nyt_counties': 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv',
+    'nyt_states': 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv',
+}
+
+# Sources the daily refresh actually parses
+REFRESH_SOURCES = ['jhu_cases', 'jhu_deaths', 'nyt_counties']
+
+
+def http_transport(url, timeout=120):
+    """ Download a URL and return the raw bytes """
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def local_file_transport(path):
+    """ Read a local file and return the raw bytes """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def csv_source(data):
+    """
+    read_csv input for fetched data: either raw bytes or the
+    path of a cached file (see cached_file_transport)
+    """
+    return data if isinstance(data, str) else io.BytesIO(data)
+
+
+def fetched_size(data):
+    """ Size in bytes of fetched data (raw bytes or a file path) """
+    return os.path.getsize(data) if isinstance(data, str) else len(data)
+
+
+class SourceFetcher():
+    """
+    Fetch a set of named sources at the same time.
+    The transport is any callable taking a location and returning bytes
+    (or, like cached_file_transport, the path of a local copy), so the
+    fetcher can be pointed at local files or a local HTTP server.
+    By default downloads go through the conditional-GET HTTP cache.
+    """
+    def __init__(self, names=None, sources=None, transport=cached_http_transport, max_workers=None):
+        sources = sources or SOURCE_URLS
+        names = names or list(sources)
+        self.sources = {name: sources[name] for name in names}
+        self.transport = transport
+        self.max_workers = max_workers or len(self.sources)
+        self.data = {}
+
+    def fetch(self):
+        """
+        Start every download at once and wait for all of them.
+        Any failed download is raised once the others have finished.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(self.transport, location)
+                       for name, location in self.sources.items()}
+
+            for name, future in futures.items():
+                self.data[name] = future.result()
+                LOGGER.info(f"Fetched {name}: {fetched_size(self.data[name])} bytes")
+
+        return self.data
@@ -0,0 +1,185 @@
+"""
+On-disk result cache for whole pipelines.
+A pipeline's key is a hash of its raw source files (or its parent
+pipeline's key), its settings, and the code and reference tables; each
+stage's key chains that with the stage names before it. Keys never
+depend on a stage's own output, so a stage is only reused when
+everything upstream of it is byte-for-byte the same - in practice
+a rerun with unchanged sources, code and settings, which is then
+restored without parsing anything. Any change reruns the pipeline.
+Only the stages asked for (by default the last one) are written out.
+"""
+# pylint: disable=invalid-name, line-too-long
+import os
+import glob
+import pickle
+import hashlib
+import logging
+from functools import lru_cache
+import pandas as pd
+from profiling import PROFILER
+from disk_cache import DiskCache
+
+LOGGER = logging.getLogger()
+
+SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
+REF_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'ref_data')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'cache', 'stages')
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """
+    Hash of the pipeline code and reference tables. Any edit
+    to either invalidates every cached stage.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(SCRIPTS_DIR, '*.py')) + glob.glob(os.path.join(REF_DIR, '*.csv'))):
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def source_fingerprint(data):
+    """ Hash of fetched source data: raw bytes or the path of a cached file """
+    digest = hashlib.sha256()
+    if isinstance(data, str):
+        with open(data, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    else:
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df):
+    """ Hash of a DataFrame's columns, dtypes and values """
+    digest = hashlib.sha256()
+    digest.update(repr(list(zip(df.columns, df.dtypes.astype(str)))).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class StageCache(DiskCache):
+    """
+    Stage results pickled to disk under their chained fingerprint.
+    Least recently used results are evicted once the cache grows
+    past max_bytes.
+    """
+    suffix = '.pkl'
+    label = 'Stage cache'
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        super().__init__(cache_dir, max_bytes)
+        self.enabled = enabled
+
+    def input_key(self, name, frames=(), sources=(), extra=None):
+        """
+        Starting fingerprint for a pipeline: its input frames and/or
+        raw sources, its settings and the code version.
+        None when the cache is off, so nothing is hashed for nothing.
+        """
+        if not self.enabled:
+            return None
+
+        digest = hashlib.sha256()
+        digest.update(f'{name}|{code_version()}|{extra!r}'.encode('utf-8'))
+        for df in frames:
+            digest.update(frame_fingerprint(df).encode('utf-8'))
+        for data in sources:
+            digest.update(source_fingerprint(data).encode('utf-8'))
+        return digest.hexdigest()
+
+    def derived_key(self, name, parent, extra=None):
+        """
+        Starting fingerprint for a pipeline built on another one's output:
+        chained from the parent's last stage key when it has one,
+        otherwise a hash of the parent's frame
+        """
+        parent_key = getattr(parent, 'cache_key', None)
+        if parent_key is not None:
+            return self.input_key(name, extra=(parent_key, extra))
+        return self.input_key(name, frames=[parent.data], extra=extra)
+
+    @staticmethod
+    def stage_key(parent_key, stage_name):
+        """ Fingerprint of a stage given the fingerprint of the stage before it """
+        return hashlib.sha256(f'{parent_key}|{stage_name}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def load(self, key):
+        """ Cached state for a stage, or None """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+        # Mark it as used by this run so eviction leaves it alone
+        self.touch(path)
+        return state
+
+    def store(self, key, state):
+        """ Save a stage's state """
+        self.write_atomic(self._path(key),
+                          lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def run_stages(self, obj, stages, input_key, state_attrs=('data',), cached_stages=None):
+        """
+        Run obj's stage methods in order, restoring obj from the last
+        stored stage whose key matches and rerunning only the ones after it.
+        Since keys chain from the pipeline's inputs, a match means the
+        whole run so far is unchanged; this is a result cache, not
+        per-stage memoization.
+        state_attrs are the attributes the stages produce. Only the
+        stages named in cached_stages (default: the last one) are stored,
+        so a run doesn't pay to write out every intermediate frame.
+        Returns the last stage's key, or None when the cache is off.
+        """
+        name = type(obj).__name__
+        if not self.enabled:
+            for stage in stages:
+                with PROFILER.stage(f'{name}.{stage.__name__}', obj):
+                    stage()
+            return None
+
+        if cached_stages is None:
+            cached_stages = [stages[-1].__name__]
+
+        keys = []
+        key = input_key
+        for stage in stages:
+            key = self.stage_key(key, stage.__name__)
+            keys.append(key)
+
+        start = 0
+        with PROFILER.stage(f'{name}.restore_from_cache', obj) as hit:
+            for i in reversed(range(len(stages))):
+                if stages[i].__name__ not in cached_stages:
+                    continue
+                state = self.load(keys[i])
+                if state is not None:
+                    for attr, value in state.items():
+                        setattr(obj, attr, value)
+                    start = i + 1
+                    hit['cached_through'] = stages[i].__name__
+                    LOGGER.info(f"Stage cache hit for {name}.{stages[i].__name__}")
+                    break
+
+        for stage, key in zip(stages[start:], keys[start:]):
+            with PROFILER.stage(f'{name}.{stage.__name__}', obj):
+                stage()
+            if stage.__name__ in cached_stages:
+                self.store(key, {attr: getattr(obj, attr) for attr in state_attrs if hasattr(obj, attr)})
+
+        return keys[-1]
+
+
+STAGE_CACHE = StageCache()
@@ -0,0 +1,93 @@
+"""
+Synthetic source files shaped like the real JHU and NYT downloads,
+at whatever size is asked for. Geography names come from the
+reference tables so every lookup in the pipeline finds a match.
+"""
+# pylint: disable=invalid-name, line-too-long
+import numpy as np
+import pandas as pd
+from ref_data_registry import REF_DATA
+from country_codes import get_resolver
+
+START_DATE = '2020-01-22'
+
+
+def cumulative_counts(rng, n_geos, n_days, max_daily=50):
+    """
+    Running totals for n_geos x n_days, each geography
+    starting on a random day (zero before it)
+    """
+    daily = rng.integers(0, max_daily, size=(n_geos, n_days))
+    start_day = rng.integers(0, max(n_days // 2, 1), size=n_geos)
+    daily[np.arange(n_days) < start_day[:, None]] = 0
+    return np.cumsum(daily, axis=1)
+
+
+def make_jhu_files(n_geos=300, n_days=150, seed=0):
+    """
+    (cases, deaths) CSV bytes in the JHU wide format: one row per
+    province/country and one column per date
+    """
+    rng = np.random.default_rng(seed)
+    countries = sorted(name for name, codes in get_resolver().lookup.items() if codes[1])
+
+    country = np.array(countries, dtype=object)[np.arange(n_geos) % len(countries)]
+    # The first row for each country is the country itself, later ones provinces
+    province = np.array([None if i < len(countries) else f'Province {i}' for i in range(n_geos)], dtype=object)
+
+    wide = pd.DataFrame({'Province/State': province,
+                         'Country/Region': country,
+                         'Lat': rng.uniform(-60, 70, n_geos).round(4),
+                         'Long': rng.uniform(-180, 180, n_geos).round(4)})
+
+    dates = pd.date_range(START_DATE, periods=n_days)
+    date_cols = [f'{d.month}/{d.day}/{d.year % 100}' for d in dates]
+
+    cases = cumulative_counts(rng, n_geos, n_days)
+    deaths = cases // 30
+
+    files = []
+    for counts in [cases, deaths]:
+        df = pd.concat([wide, pd.DataFrame(counts, columns=date_cols)], axis=1)
+        files.append(df.to_csv(index=False).encode('utf-8'))
+
+    return tuple(files)
+
+
+def make_nyt_file(n_counties=3000, n_days=150, seed=0):
+    """
+    CSV bytes in the NYT us-counties long format: one row per
+    county per day from the county's first case on
+    """
+    rng = np.random.default_rng(seed)
+    fips = REF_DATA.get('fips')
+    state_names = REF_DATA.get('us_states').drop_duplicates('state_code').set_index('state_code')['state_name']
+    fips['state_name'] = fips['state'].map(state_names)
+    fips = fips.dropna(subset=['state_name'])
+
+    counties = fips.iloc[np.arange(n_counties) % len(fips)].reset_index(drop=True)
+    cases = cumulative_counts(rng, n_counties, n_days)
+    dates = pd.date_range(START_DATE, periods=n_days)
+
+    # NYT only lists a county once it has cases
+    county_idx, day_idx = np.nonzero(cases > 0)
+    order = np.lexsort((county_idx, day_idx))
+    county_idx, day_idx = county_idx[order], day_idx[order]
+
+    df = pd.DataFrame({
+        'date': dates[day_idx].strftime('%Y-%m-%d'),
+        'county': counties['name'].str.replace(' County', '', regex=False).to_numpy()[county_idx],
+        'state': counties['state_name'].to_numpy()[county_idx],
+        'fips': counties['fips'].astype(float).to_numpy()[county_idx],
+        'cases': cases[county_idx, day_idx],
+        'deaths': cases[county_idx, day_idx] // 40,
+    })
+    return df.to_csv(index=False).encode('utf-8')
+
+
+def make_sources(n_jhu_geos=300, n_counties=3000, n_days=150, seed=0):
+    """ Source bytes by name, ready to pass as `sources` to the aggregators """
+    jhu_cases, jhu_deaths = make_jhu_files(n_jhu_geos, n_days, seed)
+    return {'jhu_cases': jhu_cases,
+            'jhu_deaths': jhu_deaths,
+            'nyt_counties': make_nyt_file(n_counties, n_days, seed)}
@@ -1,12 +1,14 @@
 import os
 from datetime import datetime
 import logging
-import requests
-import json
+import numpy as np
 import pandas as pd
-from pycountry import countries
 from git import Repo
-from config_corona import ConfigCorona
+from country_codes import get_resolver
+from ref_data_registry import REF_DATA
+from schema import apply_schema, count_values
+import output_writers
+from notifier import NOTIFIER
 
 
 # Set LOGGER
@@ -30,11 +32,14 @@ class AddDailyFields():
     Takes the daily running total columns and 
     adds in daily new columns and PREV day
     """
-    def __init__(self, data_obj):
+    def __init__(self, data_obj, dataset_names=None):
 
         self.data = data_obj.data
         self.dataset_name = data_obj.dataset_name
         self.key_col = data_obj.key_col
+
+        # Several metrics (e.g. cases and deaths) can share one pass
+        self.dataset_names = dataset_names or [self.dataset_name]
         
         self.col_confirmed = f"running_total_{self.dataset_name}"
         self.col_confirmed_prev_day = f"{self.col_confirmed}_prev_day"
@@ -47,195 +52,212 @@ class AddDailyFields():
         """
         df = self.data
 
-        # Prep dataset 1-day delta to get day-over-day change
-        df["previous_days_date"] = df["date"] + pd.np.timedelta64(1, "D")
-        previous_df = df.copy()
-        previous_df = previous_df[[
-                self.key_col,
-                "previous_days_date",
-                self.col_confirmed,
-                ]]
-        
-        previous_df = previous_df.rename(
-            columns={self.col_confirmed: self.col_confirmed_prev_day}
-        )
+        # Line every row up with the row holding the same key on the previous day
+        prev_idx = previous_day_index(df, self.key_col)
 
-        # Join dataset to itself with a one day offset to get daily diff
-        df = df.merge(
-            previous_df,
-            how="left",
-            left_on=[self.key_col, "date"],
-            right_on=[self.key_col, "previous_days_date"],
-        )
+        for dataset_name in self.dataset_names:
+            col_confirmed = f"running_total_{dataset_name}"
+            col_confirmed_prev_day = f"{col_confirmed}_prev_day"
 
-        df = df.drop(["previous_days_date_x", "previous_days_date_y"], axis=1)
+            prev_day = previous_day_values(df[col_confirmed], prev_idx)
+            df[col_confirmed_prev_day] = prev_day
+            df[f"daily_new_{dataset_name}"] = count_values(df[col_confirmed]) - prev_day
 
-        df[self.col_confirmed_prev_day] = df[self.col_confirmed_prev_day].fillna(0)
-        df[self.col_daily_new] = (
-            df[self.col_confirmed] - df[self.col_confirmed_prev_day]
-        )
+        self.data = apply_schema(df)
 
-        self.data = df
 
+def previous_day_index(df, key_col, date_col="date"):
+    """
+    For each row of df return the position of the row with the same key
+    on the previous calendar day, or -1 when that day is missing.
 
-def push_output_to_github():
+    Sorts once by (key, date) instead of joining the frame onto itself
+    with a one day offset. Null keys match each other, as they do in a
+    merge. When the previous day has several rows for a key, the last
+    of them (in df's order) is used.
     """
-    Automatically push changes in output_data/ to GitHub
+    n = len(df)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+
+    key_codes = pd.factorize(df[key_col])[0].astype(np.int64) + 1
+    days = df[date_col].to_numpy(dtype="datetime64[D]")
+    has_date = ~np.isnat(days)
+    if not has_date.any():
+        return np.full(n, -1, dtype=np.int64)
+
+    # One sortable integer per (key, day); every key gets a block of days
+    # with room for the day before its first date
+    day_nums = days.astype(np.int64)
+    offset = day_nums - day_nums[has_date].min() + 1
+    block = int(offset[has_date].max()) + 1
+    position = np.where(has_date, key_codes * block + offset, -1)
+
+    order = np.argsort(position, kind="stable")
+    sorted_position = position[order]
+
+    # Last row sitting exactly one day earlier under the same key
+    target = position - 1
+    found = np.searchsorted(sorted_position, target, side="right") - 1
+    found_safe = np.maximum(found, 0)
+    has_prev = has_date & (found >= 0) & (sorted_position[found_safe] == target)
+    return np.where(has_prev, order[found_safe], -1)
+
+
+def previous_day_values(values, prev_idx):
     """
-    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-
-    repo = Repo(repo_dir)
-
-    file_list = [
-        'coronavirus/output_data/HOPKINS_CLEANED.csv',
-        'coronavirus/output_data/JHU_aggregated_country_and_day.csv',
-        'coronavirus/output_data/NYT_US_state_data.csv',
-        'coronavirus/output_data/US_causes_of_death.csv', 
-    ]
-    # Add and commit
-    today = datetime.today().strftime('%Y-%m-%d')
-    commit_message = f'Adding output data for {today}'
-    repo.index.add(file_list)
-    repo.index.commit(commit_message)
+    Pull the previous day's value for each row using the positions
+    from previous_day_index. Missing days (and missing values) become 0.
+    """
+    values = count_values(values)
+    prev = np.zeros(len(values), dtype=float)
+    has_prev = prev_idx >= 0
+    prev[has_prev] = values[prev_idx[has_prev]]
+    return np.nan_to_num(prev, nan=0.0)
 
-    # Push
-    origin = repo.remote('origin')
-    origin.push()
 
-def send_slack(text):
+def zero_day_ranks(df, specs, value_col="running_total_cases", date_col="date"):
     """
-    Sends simple Slack message
+    Zero day rank columns for several (key_col, new_col_name, min_case_value)
+    specs at once.
+
+    A (key, date) qualifies when any of its rows reaches min_case_value;
+    the rank is the number of qualifying dates for that key so far.
+    Specs sharing a key_col share one sort. Returns {new_col_name: array}
+    with NaN before the threshold is reached.
     """
-    config = ConfigCorona()
-    try:
-        url = config.slack_url
-        data = {'text':text}
-        response = requests.post(url,
-                                data=json.dumps(data),
-                                headers={'Content-Type': 'application/json'})
-        if response:
-            LOGGER.info("======= Slack Success =======")
-        else:
-            LOGGER.warning("SLACK ERROR")
-    except Exception as e:
-        LOGGER.warning(f"Slack message is failing {e}")
-
-
-def pull_median_country_age():
+    n = len(df)
+    values = count_values(df[value_col])
+    dates = df[date_col].values
+    ranks = {}
+
+    for key_col in dict.fromkeys(spec[0] for spec in specs):
+        key_specs = [spec for spec in specs if spec[0] == key_col]
+        if n == 0:
+            ranks.update({name: np.array([], dtype=float) for _, name, _ in key_specs})
+            continue
+
+        key_codes = pd.factorize(df[key_col])[0]
+        order = np.lexsort((dates, key_codes))
+        sorted_keys = key_codes[order]
+        sorted_dates = dates[order]
+        sorted_values = values[order]
+
+        # Mark where each key and each (key, date) pair starts in sorted order
+        new_key = np.ones(n, dtype=bool)
+        new_key[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        new_pair = new_key.copy()
+        new_pair[1:] |= sorted_dates[1:] != sorted_dates[:-1]
+
+        pair_id = np.cumsum(new_pair) - 1
+        pair_starts = np.flatnonzero(new_pair)
+        pair_positions = np.arange(len(pair_starts))
+        key_first_pair = np.maximum.accumulate(
+            np.where(new_key[pair_starts], pair_positions, 0))
+
+        # Rows without a key or date never get a rank (groupby drops them)
+        no_rank = (sorted_keys == -1) | np.isnat(sorted_dates)
+
+        for _, new_col_name, min_case_value in key_specs:
+            qualifies = np.maximum.reduceat(
+                (sorted_values >= min_case_value).astype(np.int64), pair_starts)
+
+            # Running count of qualifying dates, restarted for every key
+            running = np.cumsum(qualifies)
+            before_key = running[key_first_pair] - qualifies[key_first_pair]
+            pair_rank = np.where(qualifies == 1, running - before_key, np.nan)
+
+            sorted_rank = pair_rank[pair_id]
+            sorted_rank[no_rank] = np.nan
+
+            rank = np.empty(n, dtype=float)
+            rank[order] = sorted_rank
+            ranks[new_col_name] = rank
+
+    return ranks
+
+
+def wide_to_long(df, id_cols, value_name, var_name="date"):
     """
-    Pull median age by country data from Wikipedia
+    Reshape a wide frame (one column per date) to long, like
+    set_index(id_cols).stack() but built straight from the NumPy block.
+    The date header is parsed once per column and missing values are
+    dropped, as stack() does.
     """
-    age_wiki = pd.read_html('https://en.wikipedia.org/wiki/List_of_countries_by_median_age')
-    df = age_wiki[0]
-    df.columns = df.columns.str.lower()
-    df.columns = ['country','rank','median_years','male_years','female_years']
-    
-    # Add country codes
-    df['country_code_2'] = df.apply(pandas_add_cc_2, axis=1)
-    df['country_code_3'] = df.apply(pandas_add_cc_3, axis=1)
+    wide_cols = [col for col in df.columns if col not in id_cols]
+    n_rows, n_cols = len(df), len(wide_cols)
 
-    df.loc[df['country'] == 'Virgin Islands', 'country_code_2'] = 'VG'
-    df.loc[df['country'] == 'Virgin Islands', 'country_code_3'] = 'VGB'
+    values = df[wide_cols].to_numpy().ravel()
+    keep = ~pd.isna(values)
 
-    df.loc[df['country'] == 'Curacao', 'country_code_2'] = 'CW'
-    df.loc[df['country'] == 'Curacao', 'country_code_3'] = 'CUW'
+    long_df = pd.DataFrame({col: np.repeat(df[col].to_numpy(), n_cols)[keep] for col in id_cols})
+    long_df[var_name] = np.tile(pd.to_datetime(pd.Index(wide_cols)).to_numpy(), n_rows)[keep]
+    long_df[value_name] = values[keep]
+    return long_df
 
-    df.loc[df['country'] == 'Sint Maarten', 'country_code_2'] = 'SX'
-    df.loc[df['country'] == 'Sint Maarten', 'country_code_3'] = 'SXM'
 
-    df.loc[df['country'] == 'Kosovo', 'country_code_2'] = 'XK'
-    df.loc[df['country'] == 'Kosovo', 'country_code_3'] = 'XKX'
-
-    df.loc[df['country'] == 'Niger', 'country_code_2'] = 'NE'
-    df.loc[df['country'] == 'Niger', 'country_code_3'] = 'NER'
-
-    df = df.drop_duplicates('country_code_3')
-
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'ref_median_age_country.csv')
-    
-    df.to_csv(filename, index=False)
-
-def pull_US_state_population_data():
+def push_output_to_github():
     """
-    Scrapes a Wikipedia page to pull US state population data
+    Automatically push changes in output_data/ to GitHub
     """
-    wiki = pd.read_html('https://simple.wikipedia.org/wiki/List_of_U.S._states_by_population')
-    df = wiki[0]
-    df.columns = df.columns.str.lower().str.replace(' ','_')
-    df = df[['state','population_estimate,_july_1,_2019[2]']]
-    df.columns = ['state','us_state_pop_2019_estimate']
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
-    df.loc[df['state'] == 'District of Columbia', 'state'] = 'Washington DC'
-    df.loc[df['state'] == 'U.S. Virgin Islands', 'state'] = 'Virgin Islands'
+    repo = Repo(repo_dir)
 
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'ref_us_state_population.csv')
+    # Only partitions whose contents changed were rewritten, so
+    # adding the partition folders stages just those files (and deletions)
+    datasets = [
+        'HOPKINS_CLEANED',
+        'JHU_aggregated_country_and_day',
+        'NYT_US_state_data',
+        'US_causes_of_death',
+    ]
+    paths = [os.path.relpath(output_writers.partition_dir(name), repo_dir) for name in datasets]
+    if output_writers.COMBINED_CSV:
+        # The single-file CSVs are still published alongside the partitions
+        paths += [os.path.relpath(output_writers.output_path(name, 'csv'), repo_dir) for name in datasets]
+    # git add fails on a path that matches nothing (an output not written yet)
+    paths = [path for path in paths if os.path.exists(os.path.join(repo_dir, path))]
+    repo.git.add('--all', '--', *paths)
+
+    if not repo.index.diff('HEAD'):
+        LOGGER.info("No output data changed - skipping commit and push")
+        return
 
-    df.to_csv(filename, index=False)
+    # Add and commit
+    today = datetime.today().strftime('%Y-%m-%d')
+    commit_message = f'Adding output data for {today}'
+    repo.index.commit(commit_message)
 
-    return df
+    # Push
+    origin = repo.remote('origin')
+    origin.push()
 
-def create_FIPS_ref_data():
+def send_slack(text):
     """
-    Load up a FIPS ref table from GitHub
+    Queues a simple Slack message (sent in the background by notifier.py)
     """
-    FIPS = pd.read_json('https://raw.githubusercontent.com/josh-byster/fips_lat_long/master/fips_map.json')
-    FIPS = FIPS.transpose().reset_index()
-    FIPS = FIPS.rename(columns={'index':'fips'})
-    FIPS['fips'] = FIPS['fips'].astype(str)
-
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'FIPS_ref_data.csv')
-
-    FIPS.to_csv(filename, index=False)
+    NOTIFIER.send(text)
 
 
 def load_FIPS_data():
     """ Load FIPS ref table """
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'FIPS_ref_data.csv')
-    df = pd.read_csv(filename)    
-    df['fips'] = df['fips'].astype(str)
-    return df
+    return REF_DATA.get('fips')
 
 def load_ref_US_state():
     """ Load US state code ref table """
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'ref_table_us_states.csv')
-    df = pd.read_csv(filename)    
-    df.columns = df.columns.str.lower().str.replace(' ','_')
-    return df
+    return REF_DATA.get('us_states')
 
 def load_ref_US_county_info():
     """ Load US county info ref table 
     Unique to the county, state, latitude, and longitude
     """
-    directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    filename = os.path.join(directory, 'ref_data', 'county_to_zip_ref.csv')
-    df = pd.read_csv(filename)    
-    df.columns = df.columns.str.lower().str.replace(' ','_')
-    return df    
+    return REF_DATA.get('county_zip')
 
 def pandas_add_cc_2(row):
     """Pandas function for pulling 2-letter country code"""
-    country = row['country']
-    #print(country)
-    try:
-        alpha_2 = countries.search_fuzzy(country)[0].alpha_2     
-        return alpha_2
-    except LookupError:
-        print("no dice")
-        pass 
+    return get_resolver().resolve(row['country'])[0]
 
 def pandas_add_cc_3(row):
     """Pandas function for pulling 3-letter country code"""
-    country = row['country']
-    #print(country)
-    try:
-        alpha_3 = countries.search_fuzzy(country)[0].alpha_3     
-        return alpha_3
-    except LookupError:
-        print("no dice")
-        pass        
-
+    return get_resolver().resolve(row['country'])[1]
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The pipeline modules import each other by their flat module names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                'coronavirus', 'python_scripts'))
@@ -0,0 +1,30 @@
+"""
+CauseOfDeath compares one country's COVID deaths with its reference causes
+"""
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from data_aggregators import CauseOfDeath
+
+
+def make_source():
+    return SimpleNamespace(data=pd.DataFrame({
+        'date': pd.to_datetime(['2020-03-01', '2020-03-01', '2020-03-02', '2020-03-01']),
+        'country_or_region': ['US', 'US', 'US', 'Canada'],
+        'daily_new_deaths': [1, 2, 4, 100]}))
+
+
+def test_only_the_country_is_counted():
+    cod = CauseOfDeath(make_source())
+    cod.check_country()
+    cod.prep_US_by_day()
+
+    assert cod.output_name == 'US_causes_of_death'
+    assert cod.df_US_by_day['daily_deaths'].tolist() == [3, 4]
+
+
+@pytest.mark.parametrize('country', ['Canada', 'France'])
+def test_country_without_both_sources_is_rejected(country):
+    # Canada has COVID deaths but no reference causes, France has neither
+    with pytest.raises(ValueError):
+        CauseOfDeath(make_source(), country=country).check_country()
@@ -0,0 +1,36 @@
+"""
+JHUCountryAggregate.aggregate keeps each group's attributes on the right row
+"""
+from types import SimpleNamespace
+import pandas as pd
+from data_aggregators import JHUCountryAggregate
+
+
+def test_missing_group_key_does_not_shift_attributes():
+    df = pd.DataFrame({'date': pd.to_datetime(['2020-03-01', '2020-03-01', '2020-03-01', '2020-03-02', '2020-03-01']),
+                       'country_or_region': [None, 'B', 'A', 'A', 'A'],
+                       'daily_new_cases': [1, 2, 3, 4, 5],
+                       'country_code_3': ['XXX', 'BBB', 'AAA', 'AAA', 'ZZZ']})
+    agg = JHUCountryAggregate(SimpleNamespace(data=df))
+    agg.cols_to_sum = ['daily_new_cases']
+
+    out = agg.aggregate(df, ['date', 'country_or_region'])
+
+    assert out[['country_or_region', 'daily_new_cases', 'country_code_3']].values.tolist() == [
+        ['A', 8, 'AAA'], ['B', 2, 'BBB'], ['A', 4, 'AAA']]
+
+
+def test_weekly_rollup_with_missing_attribute_columns():
+    df = pd.DataFrame({'date': pd.to_datetime(['2020-03-02', '2020-03-03', '2020-03-09', '2020-03-02']),
+                       'country_or_region': ['A', 'A', 'A', 'B'],
+                       'daily_new_cases': [1, 2, 4, 8],
+                       'running_total_cases': [1, 3, 7, 8],
+                       'country_code_3': ['AAA', 'AAA', 'AAA', 'BBB']})
+    agg = JHUCountryAggregate(SimpleNamespace(data=df), freq='W')
+    agg.cols_to_sum = ['daily_new_cases', 'running_total_cases']
+    agg.create_final_data()
+
+    assert agg.data.columns.tolist() == ['date', 'country_or_region', 'daily_new_cases',
+                                         'running_total_cases', 'country_code_3']
+    assert agg.data[['country_or_region', 'daily_new_cases', 'running_total_cases']].values.tolist() == [
+        ['A', 3, 3], ['B', 8, 8], ['A', 4, 7]]
@@ -0,0 +1,21 @@
+"""
+The tracked lookup table covers the country names JHU uses
+"""
+from country_codes import CountryCodeResolver
+
+
+def test_jhu_names_resolve_from_table(tmp_path):
+    resolver = CountryCodeResolver(cache_file=str(tmp_path / 'country_code_lookup.csv'))
+    expected = {'US': ('US', 'USA'),
+                'Korea, South': ('KR', 'KOR'),
+                'South Korea': ('KR', 'KOR'),
+                'Taiwan*': ('TW', 'TWN'),
+                'Congo (Kinshasa)': ('CD', 'COD'),
+                'Congo (Brazzaville)': ('CG', 'COG'),
+                'Burma': ('MM', 'MMR'),
+                'Namibia': ('NA', 'NAM'),
+                'Diamond Princess': (None, None)}
+
+    assert {name: resolver.resolve(name) for name in expected} == expected
+    # Nothing needed a fuzzy search
+    assert resolver.new_names == 0
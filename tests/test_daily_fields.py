@@ -0,0 +1,110 @@
+"""
+Parity of AddDailyFields.create_daily_new_col with the self-merge it replaced
+"""
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from utils import AddDailyFields, previous_day_index
+
+
+def reference_self_merge(df, key_col, col_confirmed):
+    """ The original implementation: join the frame onto itself shifted by one day """
+    col_confirmed_prev_day = f"{col_confirmed}_prev_day"
+    df = df.copy()
+    df["previous_days_date"] = df["date"] + np.timedelta64(1, "D")
+    previous_df = df[[key_col, "previous_days_date", col_confirmed]].rename(
+        columns={col_confirmed: col_confirmed_prev_day})
+
+    df = df.merge(
+        previous_df,
+        how="left",
+        left_on=[key_col, "date"],
+        right_on=[key_col, "previous_days_date"],
+    )
+    df = df.drop(["previous_days_date_x", "previous_days_date_y"], axis=1)
+    df[col_confirmed_prev_day] = df[col_confirmed_prev_day].fillna(0)
+    df[col_confirmed.replace("running_total_", "daily_new_")] = df[col_confirmed] - df[col_confirmed_prev_day]
+    return df
+
+
+def make_frame(seed=0, n_keys=40, n_days=30):
+    """
+    Shuffled long-format frame with date gaps, duplicate (key, date)
+    rows, null keys and NaN totals
+    """
+    rng = np.random.default_rng(seed)
+    keys = np.repeat([f"geo_{i}" for i in range(n_keys)], n_days).astype(object)
+    dates = np.tile(pd.date_range("2020-03-01", periods=n_days).to_numpy(), n_keys)
+    cases = rng.integers(0, 50, n_keys * n_days).cumsum().astype(float)
+    deaths = rng.integers(0, 5, n_keys * n_days).cumsum().astype(float)
+    df = pd.DataFrame({"key": keys, "date": dates, "running_total_cases": cases,
+                       "running_total_deaths": deaths})
+
+    # Date gaps
+    df = df[rng.random(len(df)) > 0.15]
+    # Duplicate (key, date) rows with their own totals
+    dupes = df.sample(frac=0.05, random_state=seed).copy()
+    dupes["running_total_cases"] += 7
+    # NaN totals and null keys
+    df = pd.concat([df, dupes], ignore_index=True)
+    df.loc[rng.random(len(df)) < 0.05, "running_total_cases"] = np.nan
+    df.loc[rng.random(len(df)) < 0.05, "running_total_deaths"] = np.nan
+    df.loc[rng.random(len(df)) < 0.03, "key"] = None
+
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    df["row_id"] = np.arange(len(df))
+    return df
+
+
+def daily_fields(df, dataset_names):
+    data_obj = SimpleNamespace(data=df.copy(), dataset_name=dataset_names[0], key_col="key")
+    adder = AddDailyFields(data_obj=data_obj, dataset_names=dataset_names)
+    adder.create_daily_new_col()
+    return adder.data
+
+
+def assert_matches_merge(new, reference, col):
+    """
+    Every row of new must match the merge. Where the previous day has
+    several rows for a key the merge fans a row out into one row per
+    candidate, so new must hold one of those candidates.
+    """
+    prev_col = f"{col}_prev_day"
+    daily_col = col.replace("running_total_", "daily_new_")
+    fan_out = reference.groupby("row_id")[prev_col].transform("size") > 1
+
+    single = reference[~fan_out].set_index("row_id").sort_index()
+    merged = new.set_index("row_id").loc[single.index]
+    np.testing.assert_array_equal(merged[prev_col].to_numpy(dtype=float), single[prev_col].to_numpy(dtype=float))
+    np.testing.assert_array_equal(merged[daily_col].to_numpy(dtype=float, na_value=np.nan),
+                                  single[daily_col].to_numpy(dtype=float))
+
+    candidates = reference[fan_out].groupby("row_id")[prev_col].apply(set)
+    chosen = new.set_index("row_id").loc[candidates.index, prev_col]
+    assert all(value in options for value, options in zip(chosen, candidates))
+
+
+def test_matches_self_merge():
+    df = make_frame()
+    new = daily_fields(df, ["cases", "deaths"])
+
+    assert len(new) == len(df)
+    assert new["row_id"].tolist() == df["row_id"].tolist()
+    for col in ["running_total_cases", "running_total_deaths"]:
+        assert_matches_merge(new, reference_self_merge(df, "key", col), col)
+
+
+def test_matches_self_merge_several_seeds():
+    for seed in range(1, 6):
+        df = make_frame(seed=seed, n_keys=15, n_days=20)
+        new = daily_fields(df, ["cases"])
+        assert_matches_merge(new, reference_self_merge(df, "key", "running_total_cases"), "running_total_cases")
+
+
+def test_previous_day_index_edges():
+    empty = pd.DataFrame({"key": pd.Series([], dtype=object), "date": pd.Series([], dtype="datetime64[ns]")})
+    assert len(previous_day_index(empty, "key")) == 0
+
+    df = pd.DataFrame({"key": ["a", "a", "b", "a"],
+                       "date": pd.to_datetime(["2020-03-02", "2020-03-01", "2020-03-01", None])})
+    assert previous_day_index(df, "key").tolist() == [1, -1, -1, -1]
@@ -0,0 +1,75 @@
+"""
+geo_keys ids identify the same geographies as the concatenated string keys they replaced
+"""
+import numpy as np
+import pandas as pd
+from geo_keys import FIPS_LIMIT, GEO_ID_COL, add_geo_id, encode_geo_keys, key_labels
+
+LABEL_COLS = ["province_or_state", "country_or_region"]
+
+
+def reference_string_key(df):
+    """ The original state_and_country key """
+    df = df.fillna("Not Provided")
+    return df["province_or_state"] + "-" + df["country_or_region"]
+
+
+def make_frame(seed=0, n=400):
+    """ Repeated geographies over several dates, with missing provinces and countries """
+    rng = np.random.default_rng(seed)
+    provinces = np.array([f"p{i}" for i in range(12)] + [None], dtype=object)
+    countries = np.array([f"c{i}" for i in range(5)] + [None], dtype=object)
+    return pd.DataFrame({"province_or_state": provinces[rng.integers(0, len(provinces), n)],
+                         "country_or_region": countries[rng.integers(0, len(countries), n)],
+                         "date": pd.Timestamp("2020-03-01") + pd.to_timedelta(rng.integers(0, 30, n), unit="D")})
+
+
+def assert_same_partition(ids, labels):
+    """ Rows share an id exactly when they share a label """
+    pairs = pd.DataFrame({"id": ids, "label": labels.to_numpy()}).drop_duplicates()
+    assert pairs["id"].is_unique
+    assert pairs["label"].is_unique
+
+
+def test_one_id_per_string_key():
+    for seed in range(3):
+        df = make_frame(seed).fillna("Not Provided")
+        assert_same_partition(encode_geo_keys(df, LABEL_COLS), reference_string_key(df))
+
+
+def test_missing_labels_get_their_own_id():
+    df = make_frame()
+    ids = encode_geo_keys(df, LABEL_COLS)
+    labels = df["province_or_state"].astype(str) + "-" + df["country_or_region"].astype(str)
+    assert_same_partition(ids, labels)
+
+
+def test_ids_are_stable_across_order_and_subsets():
+    df = make_frame()
+    ids = pd.Series(encode_geo_keys(df, LABEL_COLS), index=df.index)
+
+    shuffled = df.sample(frac=1, random_state=1)
+    np.testing.assert_array_equal(encode_geo_keys(shuffled, LABEL_COLS), ids[shuffled.index])
+
+    # An incremental run sees only the newest rows and must reuse the same ids
+    recent = df[df["date"] >= "2020-03-25"]
+    np.testing.assert_array_equal(encode_geo_keys(recent, LABEL_COLS), ids[recent.index])
+
+
+def test_fips_codes_used_where_valid():
+    df = pd.DataFrame({"province_or_state": ["A", "A", "B", "B", "C"],
+                       "county": ["x", "x", "y", "Unknown", "New York City"],
+                       "fips": ["01001", 1001.0, "02013", None, "not a code"]})
+    ids = encode_geo_keys(df, ["province_or_state", "county"], fips_col="fips")
+
+    assert list(ids[:3]) == [1001, 1001, 2013]
+    assert (ids[3:] >= FIPS_LIMIT).all()
+    assert ids[3] != ids[4]
+
+
+def test_key_labels_match_string_key():
+    df = add_geo_id(make_frame().fillna("Not Provided"), LABEL_COLS)
+    labels = key_labels(df, LABEL_COLS)
+
+    assert (labels.astype(str) == reference_string_key(df)).all()
+    assert df[GEO_ID_COL].dtype == np.int64
@@ -0,0 +1,66 @@
+"""
+An incremental run on top of earlier output matches a full rebuild
+"""
+import io
+import pandas as pd
+import pytest
+import country_codes
+import data_aggregators
+import output_writers
+from stage_cache import STAGE_CACHE
+from synthetic_data import make_sources
+
+N_DAYS = 45
+NEW_DAYS = 6
+
+
+@pytest.fixture
+def isolated_outputs(tmp_path, monkeypatch):
+    """ Outputs, caches and the country code cache all under tmp_path """
+    monkeypatch.setattr(output_writers, 'OUTPUT_DIR', str(tmp_path / 'output'))
+    monkeypatch.setattr(STAGE_CACHE, 'enabled', False)
+    resolver = country_codes.CountryCodeResolver(cache_file=str(tmp_path / 'country_code_lookup.csv'))
+    monkeypatch.setattr(data_aggregators, 'get_resolver', lambda: resolver)
+    return tmp_path
+
+
+def truncated(sources, n_days):
+    """ The same sources as they were n_days days earlier """
+    cases = pd.read_csv(io.BytesIO(sources['jhu_cases']))
+    deaths = pd.read_csv(io.BytesIO(sources['jhu_deaths']))
+    counties = pd.read_csv(io.BytesIO(sources['nyt_counties']))
+    last_date = pd.to_datetime(counties['date']).max() - pd.Timedelta(days=n_days)
+    return {'jhu_cases': cases.iloc[:, :-n_days].to_csv(index=False).encode('utf-8'),
+            'jhu_deaths': deaths.iloc[:, :-n_days].to_csv(index=False).encode('utf-8'),
+            'nyt_counties': counties[pd.to_datetime(counties['date']) <= last_date].to_csv(index=False).encode('utf-8')}
+
+
+def comparable(df, sort_cols):
+    """ Plain dtypes and a fixed row order """
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df.sort_values(sort_cols).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('cls', [data_aggregators.GlobalDataJHU, data_aggregators.USDataNYT])
+def test_incremental_matches_full_rebuild(isolated_outputs, cls):
+    sources = make_sources(n_jhu_geos=60, n_counties=150, n_days=N_DAYS, seed=3)
+
+    full = cls(sources=dict(sources))
+    full.run()
+
+    # Yesterday's output, then today's run only adds the new days to it
+    earlier = cls(sources=truncated(sources, NEW_DAYS))
+    earlier.run()
+    output_writers.write_output(earlier.data, cls.output_name)
+
+    incremental = cls(sources=dict(sources), incremental=True)
+    incremental.run()
+    assert incremental.is_incremental
+
+    sort_cols = ['date', 'geo_id'] if 'geo_id' in full.data.columns else list(full.data.columns[:4])
+    pd.testing.assert_frame_equal(comparable(incremental.data, sort_cols),
+                                  comparable(full.data, sort_cols),
+                                  check_dtype=False)
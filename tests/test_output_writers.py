@@ -0,0 +1,36 @@
+"""
+Partitioned output keeps the combined CSV and accounts for every row
+"""
+import logging
+import os
+import pandas as pd
+import output_writers
+
+
+def make_frame():
+    return pd.DataFrame({'date': pd.to_datetime(['2020-03-30', '2020-03-31', '2020-04-01', None]),
+                         'province_or_state': ['A', 'B', 'A', 'B'],
+                         'daily_new_cases': [1, 2, 3, 4]})
+
+
+def test_combined_csv_written_with_partitions(tmp_path):
+    df = make_frame().iloc[:3]
+    changed = output_writers.write_output(df, 'TEST', formats=['csv'], output_dir=str(tmp_path))
+
+    combined = tmp_path / 'TEST.csv'
+    assert str(combined) in changed
+    pd.testing.assert_frame_equal(pd.read_csv(combined, parse_dates=['date']), df)
+    pd.testing.assert_frame_equal(output_writers.read_partitions('TEST', str(tmp_path)), df)
+
+    # Nothing changed, so nothing is rewritten
+    assert output_writers.write_output(df, 'TEST', formats=['csv'], output_dir=str(tmp_path)) == []
+    assert os.path.exists(combined)
+
+
+def test_undated_rows_are_reported(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        output_writers.write_partitions(make_frame(), 'TEST', output_dir=str(tmp_path))
+
+    assert '1 rows have no date' in caplog.text
+    manifest = output_writers.load_manifest('TEST', str(tmp_path))
+    assert sum(saved['rows'] for saved in manifest['partitions'].values()) == 3
@@ -0,0 +1,74 @@
+"""
+Parity of RollingMetrics with per-geography pandas rolling windows
+"""
+import numpy as np
+import pandas as pd
+from rolling_metrics import RollingMetrics
+
+
+def reference_rolling(df, metrics):
+    """ The same metrics from a daily-resampled rolling window per geography """
+    out = []
+    for _, geo in df.groupby("key", sort=False):
+        geo = geo.sort_values("date")
+        daily = geo.set_index("date")["daily_new_cases"].fillna(0).asfreq("D", fill_value=0)
+
+        result = pd.DataFrame(index=geo.index)
+        for window in metrics.windows:
+            total = daily.rolling(window).sum()
+            result[f"new_cases_{window}d_sum"] = total.reindex(geo["date"]).to_numpy()
+            result[f"new_cases_{window}d_avg"] = np.round(result[f"new_cases_{window}d_sum"] / window, 3)
+
+        week = metrics.growth_window
+        this_week = daily.rolling(week).sum()
+        last_week = this_week.shift(week)
+        growth = (this_week / last_week - 1).where(last_week > 0)
+        result["new_cases_wow_growth"] = np.round(growth.reindex(geo["date"]).to_numpy(), 4)
+
+        # Latest earlier row at least doubling_window days back
+        then = pd.merge_asof(geo[["date"]].assign(lookup=geo["date"] - pd.Timedelta(days=metrics.doubling_window)),
+                             geo[["date", "running_total_cases"]].rename(columns={"date": "then_date"}),
+                             left_on="lookup", right_on="then_date")
+        totals = geo["running_total_cases"].to_numpy(dtype=float)
+        then_totals = then["running_total_cases"].to_numpy(dtype=float)
+        elapsed = (geo["date"].to_numpy() - then["then_date"].to_numpy()) / np.timedelta64(1, "D")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            doubling = np.log(2) / (np.log(totals / then_totals) / elapsed)
+        result["cases_doubling_days"] = np.round(np.where((then_totals > 0) & (totals > then_totals), doubling, np.nan), 2)
+        out.append(result)
+
+    return pd.concat(out).reindex(df.index)
+
+
+def make_frame(seed=0, n_keys=15, n_days=60):
+    """ Shuffled rows, one per geography and date, with gaps and missing counts """
+    rng = np.random.default_rng(seed)
+    keys = np.repeat(np.arange(n_keys) * 7919, n_days)
+    dates = np.tile(pd.date_range("2020-03-01", periods=n_days).to_numpy(), n_keys)
+    daily = rng.integers(0, 40, n_keys * n_days).astype(float)
+    df = pd.DataFrame({"key": keys, "date": dates, "daily_new_cases": daily})
+    df["running_total_cases"] = df.groupby("key")["daily_new_cases"].cumsum()
+
+    df = df[rng.random(len(df)) > 0.2].copy()
+    df.loc[rng.random(len(df)) < 0.05, "daily_new_cases"] = np.nan
+    df["daily_new_cases"] = df["daily_new_cases"].astype("Int64")
+    return df.sample(frac=1, random_state=seed)
+
+
+def test_matches_pandas_rolling():
+    metrics = RollingMetrics(value_cols=["daily_new_cases"], windows=(3, 7))
+    for seed in range(3):
+        df = make_frame(seed)
+        results = metrics.compute(df, df["key"].to_numpy())
+        reference = reference_rolling(df, metrics)
+
+        assert list(results) == metrics.columns()
+        for col in metrics.columns():
+            np.testing.assert_allclose(results[col], reference[col].to_numpy(dtype=float), equal_nan=True, err_msg=col)
+
+
+def test_empty_frame():
+    metrics = RollingMetrics()
+    df = make_frame().iloc[:0]
+    results = metrics.compute(df, df["key"].to_numpy())
+    assert all(len(values) == 0 for values in results.values())
@@ -0,0 +1,51 @@
+"""
+apply_schema changes dtypes without changing values
+"""
+import numpy as np
+import pandas as pd
+from schema import apply_schema, count_values, map_values
+
+
+def make_frame():
+    return pd.DataFrame({"province_or_state": ["Ontario", None, "Ontario", "Quebec"],
+                         "country_or_region": ["Canada", "France", "Canada", "Canada"],
+                         "running_total_cases": [1.0, np.nan, 3.0000001, 12.0],
+                         "daily_new_cases": [1, 2, 0, -1],
+                         "note": pd.Categorical(["a", "b", "a", None])})
+
+
+def as_list(series):
+    """ Values with every kind of missing as None """
+    return [None if pd.isna(value) else value for value in series.astype(object)]
+
+
+def test_values_survive_schema():
+    df = make_frame()
+    expected = df.copy()
+    out = apply_schema(df.copy())
+
+    assert out["province_or_state"].dtype == "category"
+    assert out["running_total_cases"].dtype == "Int64"
+    assert not isinstance(out["note"].dtype, pd.CategoricalDtype)
+
+    for col in ["province_or_state", "country_or_region", "daily_new_cases", "note"]:
+        assert as_list(out[col]) == as_list(expected[col]), col
+    # Counts are rounded to whole numbers
+    np.testing.assert_array_equal(count_values(out["running_total_cases"]), [1.0, np.nan, 3.0, 12.0])
+
+
+def test_schema_is_idempotent():
+    once = apply_schema(make_frame())
+    twice = apply_schema(once.copy())
+    pd.testing.assert_frame_equal(once, twice)
+
+
+def test_map_values_matches_series_map():
+    keys = pd.Series(["Ontario", None, "Quebec", "Yukon", "Ontario"])
+    mapping = {"Ontario": "ON", "Quebec": "QC"}
+
+    expected = keys.map(mapping)
+    mapped = map_values(keys.astype("category"), mapping)
+
+    assert not isinstance(mapped.dtype, pd.CategoricalDtype)
+    pd.testing.assert_series_equal(mapped, expected, check_dtype=False)
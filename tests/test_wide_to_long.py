@@ -0,0 +1,48 @@
+"""
+Parity of utils.wide_to_long with the set_index().stack() it replaced
+"""
+import numpy as np
+import pandas as pd
+from utils import wide_to_long
+
+ID_COLS = ["province_or_state", "country_or_region", "Lat", "Long"]
+
+
+def reference_stack(df, index_cols, value_name):
+    """ The original stack_initial_dataset reshape """
+    df = df.set_index(index_cols).stack().reset_index(name=value_name)
+    df = df.rename(columns={"level_4": "date"})
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def make_wide(seed=0, n_rows=25, n_days=20):
+    """ JHU-style wide frame with NaN provinces and NaN counts """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"province_or_state": [f"p{i}" if i % 4 else np.nan for i in range(n_rows)],
+                       "country_or_region": [f"c{i % 6}" for i in range(n_rows)],
+                       "Lat": rng.random(n_rows),
+                       "Long": rng.random(n_rows)})
+    for day in pd.date_range("2020-01-22", periods=n_days):
+        values = rng.integers(0, 100, n_rows).astype(float)
+        values[rng.random(n_rows) < 0.1] = np.nan
+        df[f"{day.month}/{day.day}/{day.year % 100}"] = values
+    return df
+
+
+def test_matches_stack():
+    for seed in range(3):
+        df = make_wide(seed)
+        long_df = wide_to_long(df, ID_COLS, "running_total_cases")
+        reference = reference_stack(df, ID_COLS, "running_total_cases")
+
+        pd.testing.assert_frame_equal(long_df, reference, check_dtype=False)
+
+
+def test_all_missing_row_is_dropped():
+    df = make_wide(n_rows=3, n_days=4)
+    df.iloc[1, len(ID_COLS):] = np.nan
+    long_df = wide_to_long(df, ID_COLS, "running_total_cases")
+
+    assert len(long_df) == df.iloc[:, len(ID_COLS):].notna().sum().sum()
+    assert "c1" not in set(long_df["country_or_region"])
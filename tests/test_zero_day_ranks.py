@@ -0,0 +1,61 @@
+"""
+Parity of utils.zero_day_ranks with the per-spec groupby rank + merge it replaced
+"""
+import numpy as np
+import pandas as pd
+from utils import zero_day_ranks
+
+SPECS = [("key", "first_rank", 5),
+         ("key", "hundred_rank", 100),
+         ("group", "group_first_rank", 5)]
+
+
+def reference_groupby_rank(df, key_col, new_col_name, min_case_value):
+    """ The original zero_day_field_creator """
+    cases_only = df.loc[df["running_total_cases"] >= min_case_value]
+    states = cases_only.groupby([key_col, 'date'])['daily_new_cases'].sum().reset_index()
+    states[new_col_name] = states.groupby([key_col])["date"].rank(ascending=True)
+
+    states = states[[key_col, new_col_name, 'date']]
+    return df.merge(states, how='left', on=[key_col, 'date'])
+
+
+def make_frame(seed=0, n_keys=30, n_days=40):
+    """
+    Shuffled frame with date gaps, duplicate (key, date) rows,
+    NaN keys and NaN totals; several keys share a group
+    """
+    rng = np.random.default_rng(seed)
+    keys = np.repeat([f"geo_{i}" for i in range(n_keys)], n_days).astype(object)
+    groups = np.repeat([f"group_{i % 7}" for i in range(n_keys)], n_days).astype(object)
+    dates = np.tile(pd.date_range("2020-03-01", periods=n_days).to_numpy(), n_keys)
+    cases = (rng.integers(0, 12, n_keys * n_days).reshape(n_keys, n_days).cumsum(axis=1)).ravel().astype(float)
+    df = pd.DataFrame({"key": keys, "group": groups, "date": dates,
+                       "running_total_cases": cases, "daily_new_cases": 1.0})
+
+    df = df[rng.random(len(df)) > 0.15]
+    dupes = df.sample(frac=0.05, random_state=seed).copy()
+    dupes["running_total_cases"] = dupes["running_total_cases"] - 4
+    df = pd.concat([df, dupes], ignore_index=True)
+    df.loc[rng.random(len(df)) < 0.05, "running_total_cases"] = np.nan
+    df.loc[rng.random(len(df)) < 0.03, "key"] = None
+    df.loc[rng.random(len(df)) < 0.03, "group"] = None
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_matches_groupby_rank():
+    for seed in range(4):
+        df = make_frame(seed)
+        ranks = zero_day_ranks(df, SPECS)
+
+        for key_col, new_col_name, min_case_value in SPECS:
+            reference = reference_groupby_rank(df, key_col, new_col_name, min_case_value)
+            # The merge keeps df's row order (each (key, date) pair is unique on the right)
+            assert len(reference) == len(df)
+            np.testing.assert_array_equal(ranks[new_col_name], reference[new_col_name].to_numpy(dtype=float))
+
+
+def test_empty_frame():
+    df = make_frame().iloc[:0]
+    ranks = zero_day_ranks(df, SPECS)
+    assert all(len(ranks[name]) == 0 for _, name, _ in SPECS)